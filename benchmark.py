@@ -0,0 +1,248 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+
+from information_api import read_capture_file, find_capture_file
+from header_catalog import load_header_catalog, STANDARD_HEADER_FILES
+from parser import extract_capture_values, parse_nested_json
+from header_analysis import get_headers, iter_headers, build_header_table, stream_custom_headers
+from pipeline_filtering import heuristics_filtering_pipeline, columnar_filtering_pipeline
+from permutation_filtering_stats import permutation_statistics, columnar_permutation_statistics
+from storage_matcher import StorageMatcher
+from domain_resolver import resolve_host
+
+# Sites of the checked-in corpus
+CORPUS = ["www.planfix.com", "www.bbcamerica.com", "bnnbloomberg.ca"]
+SCALES = [1, 10, 100]
+
+#####################################
+# Corpus
+#####################################
+def load_site(result_base_folder, hostname):
+    capture_folder = os.path.join(result_base_folder, hostname, "capture")
+    site = {
+        "hostname": hostname,
+        "all_headers": read_capture_file(capture_folder + "/all_headers"),
+        "storage_values": read_capture_file(capture_folder + "/storage_values"),
+        "cookies": read_capture_file(capture_folder + "/cookies"),
+        # Storage is saved parsed, the browser hands it over as strings
+        "raw_storages": [
+            serialize_storage(read_capture_file(capture_folder + "/" + name))
+            for name in ("local_storage", "session_storage")
+        ],
+        "network_events": None
+    }
+    try:
+        find_capture_file(capture_folder + "/network_events")
+        site["network_events"] = read_capture_file(capture_folder + "/network_events")
+    except FileNotFoundError:
+        pass
+    return site
+
+def serialize_storage(storage):
+    return {key: value if isinstance(value, str) else json.dumps(value) for key, value in storage.items()}
+
+def scale_site(site, scale):
+    # A capture scaled k times is k visits of the same page, replayed in sequence. Each
+    # visit gets its own header values (as fresh IDs and timestamps would), otherwise the
+    # copies collapse into the same deduplicated rows and the columnar stages do not scale.
+    scaled = dict(site)
+    scaled["all_headers"] = site["all_headers"] + [
+        dict(header, header_value=f"{header['header_value']}#{copy}")
+        for copy in range(1, scale) for header in site["all_headers"]
+    ]
+    scaled["cookies"] = site["cookies"] * scale
+    scaled["raw_storages"] = [
+        {f"{key}#{copy}" if copy else key: value for copy in range(scale) for key, value in storage.items()}
+        for storage in site["raw_storages"]
+    ]
+    if site["network_events"] is not None:
+        scaled["network_events"] = site["network_events"] * scale
+    return scaled
+
+#####################################
+# Stages
+#####################################
+# Each stage: (name, function(site, context) -> number of items processed, or None if not applicable)
+def stage_get_headers(site, context):
+    if site["network_events"] is None:
+        return None
+    resolve_host.cache_clear()
+    return len(get_headers(site["network_events"], "http://" + site["hostname"]))
+
+def stage_parser(site, context):
+    json_cache = {}
+    storages = [parse_nested_json(storage, cache=json_cache) for storage in site["raw_storages"]]
+    extract_capture_values(site["cookies"], *storages)
+    return sum(len(storage) for storage in site["raw_storages"]) + len(site["cookies"])
+
+def stage_pipeline(site, context):
+    heuristics_filtering_pipeline(site["all_headers"], context["standard_headers"],
+                                  StorageMatcher(site["storage_values"]), context["output_folder"])
+    return len(site["all_headers"])
+
+def stage_pipeline_columnar(site, context):
+    columnar_filtering_pipeline(build_header_table(site["all_headers"]), context["standard_headers"],
+                                StorageMatcher(site["storage_values"]), context["output_folder"])
+    return len(site["all_headers"])
+
+def stage_permutations(site, context):
+    permutation_statistics(site["all_headers"], context["standard_headers"],
+                           StorageMatcher(site["storage_values"]), context["output_folder"])
+    return len(site["all_headers"])
+
+def stage_permutations_columnar(site, context):
+    columnar_permutation_statistics(build_header_table(site["all_headers"]), context["standard_headers"],
+                                    StorageMatcher(site["storage_values"]), context["output_folder"])
+    return len(site["all_headers"])
+
+def stage_streaming(site, context):
+    # Pipeline and permutations in one pass, from the events when the capture has them
+    if site["network_events"] is not None:
+        headers = iter_headers(site["network_events"], "http://" + site["hostname"])
+    else:
+        headers = iter(site["all_headers"])
+    _, _, n_headers = stream_custom_headers(headers, context["standard_headers"], StorageMatcher(site["storage_values"]),
+                                            context["output_folder"], context["output_folder"])
+    return n_headers
+
+STAGES = [
+    ("get_headers", stage_get_headers),
+    ("parser", stage_parser),
+    ("pipeline", stage_pipeline),
+    ("pipeline_columnar", stage_pipeline_columnar),
+    ("permutations", stage_permutations),
+    ("permutations_columnar", stage_permutations_columnar),
+    ("streaming", stage_streaming)
+]
+
+#####################################
+# Measurement
+#####################################
+def measure(stage, site, context, repeats):
+    # Best wall time of `repeats` runs, then one traced run for the peak memory
+    # Progress prints of the stages are silenced
+    times = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            n_items = stage(site, context)
+            times.append(time.perf_counter() - start)
+            if n_items is None:
+                return None
+
+        tracemalloc.start()
+        stage(site, context)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    best = min(times)
+    return {
+        "items": n_items,
+        "best_seconds": round(best, 6),
+        "mean_seconds": round(sum(times) / len(times), 6),
+        "items_per_second": round(n_items / best, 1) if best else None,
+        "peak_memory_bytes": peak
+    }
+
+def run_benchmarks(result_base_folder="results", sites=CORPUS, scales=SCALES, stages=None, repeats=3):
+    stage_names = stages or [name for name, _ in STAGES]
+    output_folder = tempfile.mkdtemp(prefix="benchmark_")
+    context = {
+        "standard_headers": load_header_catalog(*STANDARD_HEADER_FILES),
+        # Reports are written, like a real run, but to a throw-away folder
+        "output_folder": output_folder
+    }
+
+    results = []
+    try:
+        for hostname in sites:
+            site = load_site(result_base_folder, hostname)
+            for scale in scales:
+                scaled = scale_site(site, scale)
+                for name, stage in STAGES:
+                    if name not in stage_names:
+                        continue
+                    result = measure(stage, scaled, context, repeats)
+                    if result is None:
+                        continue
+                    result.update(site=hostname, scale=scale, stage=name)
+                    results.append(result)
+                    print_result(result)
+    finally:
+        shutil.rmtree(output_folder, ignore_errors=True)
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": repeats,
+        "results": results
+    }
+
+#####################################
+# Reporting
+#####################################
+def print_result(result):
+    print(f"{result['site']:<22} x{result['scale']:<4} {result['stage']:<22} "
+          f"{result['best_seconds']:>10.4f}s {result['items_per_second']:>14,.0f}/s "
+          f"{result['peak_memory_bytes'] / 2**20:>9.1f} MiB")
+
+def compare(baseline_file, current_file):
+    # Speedup of current over baseline for every (site, scale, stage) both files have
+    baseline = {(r["site"], r["scale"], r["stage"]): r for r in load_results(baseline_file)["results"]}
+    current = load_results(current_file)
+    print(f"{'site':<22} {'scale':<5} {'stage':<22} {'baseline':>10} {'current':>10} {'speedup':>8} {'memory':>8}")
+    for result in current["results"]:
+        before = baseline.get((result["site"], result["scale"], result["stage"]))
+        if before is None:
+            continue
+        speedup = before["best_seconds"] / result["best_seconds"] if result["best_seconds"] else float("inf")
+        memory = result["peak_memory_bytes"] / before["peak_memory_bytes"] if before["peak_memory_bytes"] else float("inf")
+        print(f"{result['site']:<22} x{result['scale']:<4} {result['stage']:<22} "
+              f"{before['best_seconds']:>9.4f}s {result['best_seconds']:>9.4f}s {speedup:>7.2f}x {memory:>7.2f}x")
+
+def load_results(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+#####################################
+# Command line
+#####################################
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark the header pipeline on the results corpus.")
+    arg_parser.add_argument("--results", default="results", help="results folder holding the captures")
+    arg_parser.add_argument("--sites", nargs="+", default=CORPUS)
+    arg_parser.add_argument("--scales", nargs="+", type=int, default=SCALES)
+    arg_parser.add_argument("--stages", nargs="+", choices=[name for name, _ in STAGES])
+    arg_parser.add_argument("--repeats", type=int, default=3)
+    arg_parser.add_argument("--output", help="JSON file for the results (default: benchmarks/<commit>.json)")
+    arg_parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                            help="compare two result files instead of running")
+    args = arg_parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    report = run_benchmarks(args.results, args.sites, args.scales, args.stages, args.repeats)
+    output = args.output or os.path.join("benchmarks", f"{report['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[✓] Results saved to {output}")
@@ -0,0 +1,280 @@
+import os
+import sys
+import json
+import zlib
+import struct
+import argparse
+
+# File layout: MAGIC + kind byte + zlib stream of length-prefixed records.
+# A "list" file holds one record per element so it can be read back as a stream,
+# a "value" file holds a single record. Strings are dictionary encoded: the first
+# occurrence is stored inline and given an id, later occurrences only store the id.
+MAGIC = b"CHX1"
+KIND_LIST = b"L"
+KIND_VALUE = b"V"
+EXTENSION = ".bin"
+# Left as JSON by the converter: the completion marker (with the settle timing) of a capture
+KEEP_JSON_FILES = {"capture_info.json"}
+
+# Longer strings are almost always unique, keep them out of the string table
+MAX_INTERNED_LENGTH = 256
+
+T_NONE, T_FALSE, T_TRUE, T_INT, T_FLOAT, T_NEW_STR, T_STR_REF, T_RAW_STR, T_LIST, T_DICT = range(10)
+
+FLOAT = struct.Struct("<d")
+
+#####################################
+# Writer
+#####################################
+class CaptureWriter:
+    # Written aside and renamed on close: a crash never leaves a truncated capture in place
+    def __init__(self, path, kind=KIND_LIST, level=6):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.temp_path = f"{path}.{os.getpid()}.tmp"
+        self.file = open(self.temp_path, "wb")
+        self.file.write(MAGIC + kind)
+        self.compressor = zlib.compressobj(level)
+        self.strings = {}
+        self.n_records = 0
+
+    def write(self, record):
+        payload = bytearray()
+        self.encode(record, payload)
+        self.file.write(self.compressor.compress(encode_varint(len(payload)) + payload))
+        self.n_records += 1
+
+    def close(self):
+        self.file.write(self.compressor.flush())
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def encode(self, value, out):
+        if value is None:
+            out.append(T_NONE)
+        elif value is True:
+            out.append(T_TRUE)
+        elif value is False:
+            out.append(T_FALSE)
+        elif isinstance(value, int):
+            out.append(T_INT)
+            out += encode_varint(value << 1 if value >= 0 else ((-value) << 1) - 1)
+        elif isinstance(value, float):
+            out.append(T_FLOAT)
+            out += FLOAT.pack(value)
+        elif isinstance(value, str):
+            self.encode_string(value, out)
+        elif isinstance(value, dict):
+            out.append(T_DICT)
+            out += encode_varint(len(value))
+            for key, item in value.items():
+                self.encode_string(str(key), out)
+                self.encode(item, out)
+        elif isinstance(value, (list, tuple, set)):
+            out.append(T_LIST)
+            out += encode_varint(len(value))
+            for item in value:
+                self.encode(item, out)
+        else:
+            raise TypeError(f"Cannot encode {type(value).__name__} in a capture file")
+
+    def encode_string(self, value, out):
+        string_id = self.strings.get(value)
+        if string_id is not None:
+            out.append(T_STR_REF)
+            out += encode_varint(string_id)
+            return
+
+        data = value.encode("utf-8")
+        if len(value) <= MAX_INTERNED_LENGTH:
+            self.strings[value] = len(self.strings)
+            out.append(T_NEW_STR)
+        else:
+            out.append(T_RAW_STR)
+        out += encode_varint(len(data))
+        out += data
+
+#####################################
+# Reader
+#####################################
+def iter_capture(path, chunk_size=1 << 16):
+    # Streams the records of a capture file without loading it whole
+    with open(path, "rb") as f:
+        header = f.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+
+        decompressor = zlib.decompressobj()
+        strings = []
+        buffer = b""
+        position = 0
+        while True:
+            chunk = f.read(chunk_size)
+            buffer = buffer[position:] + (decompressor.decompress(chunk) if chunk else decompressor.flush())
+            position = 0
+
+            # Decode every complete record in the buffer
+            while True:
+                length, start = decode_varint(buffer, position)
+                if length is None or start + length > len(buffer):
+                    break
+                record, _ = decode(buffer, start, strings)
+                position = start + length
+                yield record
+
+            if not chunk:
+                break
+
+        # The stream must end exactly after the last record
+        if not decompressor.eof or decompressor.unused_data or position != len(buffer):
+            raise ValueError(f"{path} is truncated or corrupted")
+
+def read_capture(path):
+    with open(path, "rb") as f:
+        kind = f.read(len(MAGIC) + 1)[len(MAGIC):]
+    records = list(iter_capture(path))
+    if kind == KIND_VALUE:
+        if len(records) != 1:
+            raise ValueError(f"{path} is truncated or corrupted")
+        return records[0]
+    return records
+
+def decode(buffer, position, strings):
+    tag = buffer[position]
+    position += 1
+
+    if tag == T_STR_REF:
+        string_id, position = decode_varint(buffer, position)
+        return strings[string_id], position
+    if tag == T_NEW_STR or tag == T_RAW_STR:
+        length, position = decode_varint(buffer, position)
+        value = buffer[position:position + length].decode("utf-8")
+        if tag == T_NEW_STR:
+            strings.append(value)
+        return value, position + length
+    if tag == T_DICT:
+        length, position = decode_varint(buffer, position)
+        value = {}
+        for _ in range(length):
+            key, position = decode(buffer, position, strings)
+            value[key], position = decode(buffer, position, strings)
+        return value, position
+    if tag == T_LIST:
+        length, position = decode_varint(buffer, position)
+        value = []
+        for _ in range(length):
+            item, position = decode(buffer, position, strings)
+            value.append(item)
+        return value, position
+    if tag == T_INT:
+        zigzag, position = decode_varint(buffer, position)
+        return (zigzag >> 1) if not zigzag & 1 else -((zigzag + 1) >> 1), position
+    if tag == T_FLOAT:
+        return FLOAT.unpack_from(buffer, position)[0], position + FLOAT.size
+    if tag == T_NONE:
+        return None, position
+    if tag == T_TRUE:
+        return True, position
+    if tag == T_FALSE:
+        return False, position
+    raise ValueError(f"Unknown tag {tag} in capture file")
+
+#####################################
+# Whole files
+#####################################
+def save_capture(data, path):
+    # Lists (and sets) are written one record per element, anything else as one record
+    if isinstance(data, (list, set)):
+        with CaptureWriter(path, KIND_LIST) as writer:
+            for record in data:
+                writer.write(record)
+    else:
+        with CaptureWriter(path, KIND_VALUE) as writer:
+            writer.write(data)
+
+def export_json(path, output_path):
+    data = read_capture(path)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(data, f, indent=2)
+
+def convert_capture_folder(capture_folder, remove_json=False):
+    converted = []
+    for filename in sorted(os.listdir(capture_folder)):
+        if not filename.endswith(".json") or filename in KEEP_JSON_FILES:
+            continue
+        json_path = os.path.join(capture_folder, filename)
+        with open(json_path, "r") as f:
+            data = json.load(f)
+        save_capture(data, json_path[:-len(".json")] + EXTENSION)
+        if remove_json:
+            os.remove(json_path)
+        converted.append(filename)
+    return converted
+
+def convert_results(result_base_folder="results", remove_json=False):
+    for hostname in sorted(os.listdir(result_base_folder)):
+        capture_folder = os.path.join(result_base_folder, hostname, "capture")
+        if os.path.isdir(capture_folder):
+            converted = convert_capture_folder(capture_folder, remove_json)
+            print(f"[✓] Converted {len(converted)} files: {hostname}")
+
+#####################################
+# Helper functions
+#####################################
+def encode_varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def decode_varint(buffer, position):
+    # Returns (None, position) when the buffer ends in the middle of the varint
+    value = 0
+    shift = 0
+    while position < len(buffer):
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+    return None, position
+
+#####################################
+# Command line
+#####################################
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Convert and export capture files.")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    convert_command = commands.add_parser("convert", help="convert the JSON captures of a results folder")
+    convert_command.add_argument("results", nargs="?", default="results")
+    convert_command.add_argument("--remove-json", action="store_true")
+
+    export_command = commands.add_parser("export", help="export a capture file as pretty JSON")
+    export_command.add_argument("capture_file")
+    export_command.add_argument("output", nargs="?")
+
+    args = arg_parser.parse_args()
+    if args.command == "convert":
+        convert_results(args.results, args.remove_json)
+    elif args.output:
+        export_json(args.capture_file, args.output)
+    else:
+        json.dump(read_capture(args.capture_file), sys.stdout, indent=2)
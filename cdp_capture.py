@@ -0,0 +1,371 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import websockets
+
+from main import get_hostname, save_site_capture
+from parser import extract_capture_values, parse_nested_json
+from header_analysis import get_headers
+from metrics import metrics
+
+# Events recorded per tab; everything else is dropped before being parsed
+KEPT_METHODS = ("Network.requestWillBeSent", "Network.responseReceived", "Network.requestWillBeSentExtraInfo")
+EVENT_PREFIX = '{"method":"'
+
+CHROME_NAMES = ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome"]
+
+class CDPError(Exception):
+    pass
+
+#####################################
+# DevTools connection
+#####################################
+class CDPConnection:
+    # One websocket to the browser; tabs are flattened sessions multiplexed over it
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.next_id = 0
+        self.pending = {}
+        # sessionId -> callback(method, params)
+        self.listeners = {}
+        self.reader = asyncio.get_running_loop().create_task(self.read_messages())
+
+    @classmethod
+    async def connect(cls, websocket_url):
+        websocket = await websockets.connect(websocket_url, max_size=None, ping_interval=None)
+        return cls(websocket)
+
+    async def send(self, method, params=None, session_id=None):
+        self.next_id += 1
+        message = {"id": self.next_id, "method": method, "params": params or {}}
+        if session_id is not None:
+            message["sessionId"] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.next_id] = future
+        await self.websocket.send(json.dumps(message))
+        return await future
+
+    async def read_messages(self):
+        try:
+            async for raw_message in self.websocket:
+                # Events start with their method name: skip unwanted ones without parsing
+                if raw_message.startswith(EVENT_PREFIX):
+                    end = raw_message.find('"', len(EVENT_PREFIX))
+                    if raw_message[len(EVENT_PREFIX):end] not in KEPT_METHODS:
+                        continue
+
+                message = json.loads(raw_message)
+                if "id" in message:
+                    future = self.pending.pop(message["id"], None)
+                    if future is None or future.done():
+                        continue
+                    if "error" in message:
+                        future.set_exception(CDPError(message["error"].get("message")))
+                    else:
+                        future.set_result(message.get("result", {}))
+                else:
+                    listener = self.listeners.get(message.get("sessionId"))
+                    if listener is not None:
+                        listener(message["method"], message.get("params", {}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("DevTools connection closed"))
+            self.pending.clear()
+
+    async def close(self):
+        await self.websocket.close()
+        await self.reader
+
+#####################################
+# Tab capture
+#####################################
+class TabRecorder:
+    # Network events of one tab, in the same shape as the Selenium performance log
+    def __init__(self):
+        self.events = []
+        # requestId -> on-the-wire request headers, one per redirect hop
+        self.extra_headers = defaultdict(list)
+        self.last_request = time.monotonic()
+
+    def on_event(self, method, params):
+        if method == "Network.requestWillBeSentExtraInfo":
+            self.extra_headers[params["requestId"]].append(params.get("headers", {}))
+            return
+        self.events.append({"method": method, "params": params})
+        if method == "Network.requestWillBeSent":
+            self.last_request = time.monotonic()
+
+    async def wait_for_network_idle(self, start, quiet_window, max_wait, poll_interval=0.1):
+        # Returns True when max_wait was reached before the network went quiet
+        while True:
+            now = time.monotonic()
+            if now - self.last_request >= quiet_window:
+                return False
+            if now - start >= max_wait:
+                return True
+            await asyncio.sleep(poll_interval)
+
+    def network_events(self):
+        # The extra info holds the headers really sent (cookies included); HTTP/2
+        # pseudo-headers (":path", ...) are not headers of the request and are left out
+        hops = defaultdict(int)
+        for event in self.events:
+            if event["method"] != "Network.requestWillBeSent":
+                continue
+            request_id = event["params"].get("requestId")
+            extra = self.extra_headers.get(request_id)
+            if extra and hops[request_id] < len(extra):
+                headers = dict(event["params"]["request"].get("headers") or {})
+                headers.update((name, value) for name, value in extra[hops[request_id]].items()
+                               if not name.startswith(":"))
+                event["params"]["request"]["headers"] = headers
+                hops[request_id] += 1
+        return self.events
+
+async def capture_tab(connection, url, quiet_window=2.0, max_wait=20):
+    # Each tab gets its own browser context, i.e. its own cookies and storage
+    context = await connection.send("Target.createBrowserContext", {"disposeOnDetach": True})
+    context_id = context["browserContextId"]
+    target = await connection.send("Target.createTarget", {"url": "about:blank", "browserContextId": context_id})
+    session = await connection.send("Target.attachToTarget", {"targetId": target["targetId"], "flatten": True})
+    session_id = session["sessionId"]
+
+    recorder = TabRecorder()
+    connection.listeners[session_id] = recorder.on_event
+    try:
+        await connection.send("Network.enable", {}, session_id)
+
+        # ======
+        # Visit url
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(connection.send("Page.navigate", {"url": url}, session_id), max_wait)
+        except (asyncio.TimeoutError, CDPError) as e:
+            print("[✗] Could not load:", url)
+            print("    Error:", str(e))
+        page_load = time.monotonic() - start
+        recorder.last_request = max(recorder.last_request, time.monotonic())
+        reached_ceiling = await recorder.wait_for_network_idle(start, quiet_window, max_wait)
+        settle_time = time.monotonic() - start
+
+        # ======
+        # Get storage information
+        cookies = (await connection.send("Network.getCookies", {}, session_id)).get("cookies", [])
+        local_storage = await evaluate(connection, session_id, "({...localStorage})")
+        session_storage = await evaluate(connection, session_id, "({...sessionStorage})")
+    finally:
+        del connection.listeners[session_id]
+        await connection.send("Target.closeTarget", {"targetId": target["targetId"]})
+        await connection.send("Target.disposeBrowserContext", {"browserContextId": context_id})
+
+    timing = {
+        "settle_seconds": round(settle_time, 3),
+        "reached_ceiling": reached_ceiling,
+        "page_load_seconds": round(page_load, 3),
+        "backend": "cdp"
+    }
+    return timing, recorder.network_events(), cookies, local_storage, session_storage
+
+async def evaluate(connection, session_id, expression):
+    result = await connection.send("Runtime.evaluate", {"expression": expression, "returnByValue": True}, session_id)
+    return result.get("result", {}).get("value") or {}
+
+#####################################
+# Capture sites
+#####################################
+async def capture_site_cdp(connection, url, base_output_folder, quiet_window=2.0, max_wait=20, capture_format="binary",
+                           save_all_headers=True):
+    hostname = get_hostname(url)
+    capture_folder = os.path.join(base_output_folder, hostname + "/capture")
+
+    timing, network_events, cookies, local_storage, session_storage = await capture_tab(
+        connection, url, quiet_window, max_wait)
+    if metrics.enabled:
+        metrics.add_time("page_load", timing["page_load_seconds"], hostname)
+        metrics.add_time("settle", timing["settle_seconds"] - timing["page_load_seconds"], hostname)
+
+    # Parsing and writing run off the event loop so the other tabs keep being served
+    def process_and_save():
+        with metrics.site(hostname):
+            with metrics.timer("storage_extraction"):
+                json_cache = {}
+                local = parse_nested_json(local_storage, cache=json_cache)
+                session = parse_nested_json(session_storage, cache=json_cache)
+                storage_values = extract_capture_values(cookies, local, session)
+            # Without all_headers, processing derives the headers from the network events
+            all_headers = None
+            if save_all_headers:
+                with metrics.timer("header_extraction"):
+                    all_headers = get_headers(network_events, hostname)
+                metrics.count("headers", len(all_headers))
+            metrics.count("events", len(network_events))
+            save_site_capture(capture_folder, url, timing, network_events, all_headers, cookies,
+                              local, session, storage_values, capture_format)
+
+    await asyncio.to_thread(process_and_save)
+    print(f"[✓] Captured: {hostname} (settled in {timing['settle_seconds']}s)")
+    return True
+
+async def capture_multiple_sites_cdp(urls, result_base_folder="results", tabs=4, site_timeout=120,
+                                     quiet_window=2.0, max_wait=20, capture_format="binary",
+                                     chrome_path=None, headless=True, save_all_headers=True):
+    # One browser, up to `tabs` sites loading at the same time
+    chrome, websocket_url, user_data_dir = launch_chrome(chrome_path, headless)
+    try:
+        connection = await CDPConnection.connect(websocket_url)
+        semaphore = asyncio.Semaphore(tabs)
+
+        async def capture(url):
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        capture_site_cdp(connection, url, result_base_folder, quiet_window, max_wait, capture_format,
+                                         save_all_headers),
+                        site_timeout)
+                except asyncio.TimeoutError:
+                    print(f"[✗] Timed out after {site_timeout}s: {url}")
+                except Exception as e:
+                    print(f"[✗] Failed: {url} — {str(e)}")
+                return False
+
+        results = await asyncio.gather(*(capture(url) for url in urls))
+        await connection.close()
+    finally:
+        close_chrome(chrome, user_data_dir)
+
+    failed = [url for url, result in zip(urls, results) if not result]
+    print(f"[✓] Captured {len(urls) - len(failed)}/{len(urls)} sites")
+    for url in failed:
+        print("    Failed:", url)
+    return dict(zip(urls, results))
+
+#####################################
+# Browser process
+#####################################
+def find_chrome():
+    chrome_path = os.environ.get("CHROME_PATH")
+    if chrome_path:
+        return chrome_path
+    for name in CHROME_NAMES:
+        chrome_path = shutil.which(name)
+        if chrome_path:
+            return chrome_path
+    raise FileNotFoundError("Chrome not found, set CHROME_PATH")
+
+def launch_chrome(chrome_path=None, headless=True, timeout=30):
+    # Port 0 lets Chrome pick a free port, written to DevToolsActivePort in the profile
+    user_data_dir = tempfile.mkdtemp(prefix="cdp_capture_")
+    arguments = [
+        chrome_path or find_chrome(),
+        "--remote-debugging-port=0",
+        f"--user-data-dir={user_data_dir}",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--disable-gpu",
+        "--no-sandbox",
+        "--disable-dev-shm-usage",
+        "about:blank"
+    ]
+    if headless:
+        arguments.append("--headless=new")
+    chrome = subprocess.Popen(arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    active_port_file = os.path.join(user_data_dir, "DevToolsActivePort")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if chrome.poll() is not None:
+            break
+        try:
+            with open(active_port_file, "r") as f:
+                port, path = f.read().split()[:2]
+            return chrome, f"ws://127.0.0.1:{port}{path}", user_data_dir
+        except (OSError, ValueError):
+            time.sleep(0.1)
+
+    close_chrome(chrome, user_data_dir)
+    raise RuntimeError("Chrome did not open its DevTools port")
+
+def close_chrome(chrome, user_data_dir):
+    chrome.terminate()
+    try:
+        chrome.wait(10)
+    except subprocess.TimeoutExpired:
+        chrome.kill()
+    shutil.rmtree(user_data_dir, ignore_errors=True)
+
+#####################################
+# Local fixture site
+#####################################
+FIXTURE_PAGE = b"""<!doctype html>
+<html><body>
+<script>
+document.cookie = "fixture_id=a1b2c3d4e5f6a7b8; path=/";
+localStorage.setItem("visitor", JSON.stringify({"id": "v1s1t0r2345678"}));
+sessionStorage.setItem("session", "s3ss10n87654321");
+fetch("/beacon", {headers: {"X-Visitor-Id": "v1s1t0r2345678"}});
+</script>
+</body></html>
+"""
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/beacon"):
+            body = b"{}"
+            content_type = "application/json"
+        else:
+            body = FIXTURE_PAGE
+            content_type = "text/html"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Fixture-Trace", "tr4c3a1b2c3d4e5")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_fixture(port=0):
+    # Local page that sets a cookie, local/session storage and sends a custom header
+    server = ThreadingHTTPServer(("127.0.0.1", port), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+#####################################
+# Command line
+#####################################
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Capture websites through the Chrome DevTools Protocol.")
+    arg_parser.add_argument("urls", nargs="*")
+    arg_parser.add_argument("--results", default="results")
+    arg_parser.add_argument("--tabs", type=int, default=4, help="sites loading at the same time")
+    arg_parser.add_argument("--site-timeout", type=int, default=120)
+    arg_parser.add_argument("--quiet-window", type=float, default=2.0)
+    arg_parser.add_argument("--max-wait", type=float, default=20)
+    arg_parser.add_argument("--capture-format", choices=["binary", "json"], default="binary")
+    arg_parser.add_argument("--save-all-headers", action=argparse.BooleanOptionalAction, default=True)
+    arg_parser.add_argument("--chrome", default=None, help="Chrome executable (default: CHROME_PATH or PATH)")
+    arg_parser.add_argument("--headless", action=argparse.BooleanOptionalAction, default=True)
+    arg_parser.add_argument("--fixture", action="store_true", help="capture the local fixture site")
+    args = arg_parser.parse_args()
+
+    urls = list(args.urls)
+    if args.fixture:
+        fixture_server, fixture_url = serve_fixture()
+        urls.append(fixture_url)
+
+    asyncio.run(capture_multiple_sites_cdp(
+        urls, args.results, args.tabs, args.site_timeout, args.quiet_window, args.max_wait,
+        args.capture_format, args.chrome, args.headless, args.save_all_headers))
@@ -0,0 +1,190 @@
+import os
+import time
+import signal
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from information_api import save_json, read_json
+from manifest import Manifest, hash_filter_config, hash_site_inputs, find_capture_inputs
+from domain_resolver import domain_cache_info
+from header_index import HeaderIndex, index_path
+from main import process_site_data
+from header_catalog import STANDARD_HEADER_FILES
+
+# Written last by capture_site_data, so its presence means the capture is complete
+CAPTURE_MARKER = "capture_info.json"
+
+# Captures made before the marker existed are taken once their files have not changed for this long
+UNMARKED_STABLE_SECONDS = 60
+
+#####################################
+# Daemon
+#####################################
+class CaptureDaemon:
+    # Watches result_base_folder/*/capture/ (and optionally a queue folder of files named
+    # after hostnames) and processes each completed capture once. Standard headers, the
+    # domain cache and the filter code stay loaded between sites.
+    def __init__(self, result_base_folder="results", queue_folder=None, poll_interval=2.0, workers=1):
+        self.result_base_folder = result_base_folder
+        self.queue_folder = queue_folder
+        self.poll_interval = poll_interval
+        self.workers = workers
+
+        self.manifest = Manifest(result_base_folder)
+        self.header_index = HeaderIndex(index_path(result_base_folder))
+        self.filter_config_hash = hash_filter_config()
+        # hostname -> capture version (marker mtime) already handled
+        self.seen = {}
+        self.stopping = False
+        self.executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        print(f"[👁] Watching {self.result_base_folder} (poll every {self.poll_interval}s)")
+
+        try:
+            while not self.stopping:
+                processed = self.poll()
+                if processed:
+                    self.update_aggregate()
+                    print(f"[✓] Processed {len(processed)} sites, domain cache: {domain_cache_info()}")
+                elif not self.stopping:
+                    time.sleep(self.poll_interval)
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+            self.header_index.close()
+        print("[✓] Daemon stopped")
+
+    def stop(self, signum, frame):
+        # Finish the site being processed, then exit
+        print(f"\n[!] Received signal {signum}, stopping")
+        self.stopping = True
+
+    def poll(self):
+        ready = []
+        for hostname, version, queued in self.find_ready_captures():
+            capture_folder = os.path.join(self.result_base_folder, hostname, "capture")
+            try:
+                inputs_hash = hash_site_inputs(capture_folder, STANDARD_HEADER_FILES, self.filter_config_hash)
+            except FileNotFoundError:
+                # A queued capture is complete: without its inputs, the entry is dropped
+                if queued:
+                    print(f"[✗] Queued site has no capture to process: {hostname}")
+                    os.remove(queued)
+                continue
+            self.seen[hostname] = version
+            if queued:
+                os.remove(queued)
+            if self.manifest.is_current(hostname, inputs_hash):
+                if queued:
+                    print(f"[=] Queued site unchanged: {hostname}")
+                continue
+            ready.append((hostname, inputs_hash))
+
+        processed = []
+        for hostname, inputs_hash, result in self.process(ready):
+            if result is None:
+                continue
+            self.manifest.record(hostname, inputs_hash, result[1])
+            self.header_index.update_site(hostname, result[0], inputs_hash, result[1])
+            processed.append(hostname)
+        return processed
+
+    def process(self, ready):
+        # Yields (hostname, inputs hash, result or None if it failed)
+        if self.executor is None:
+            for hostname, inputs_hash in ready:
+                if self.stopping:
+                    return
+                yield hostname, inputs_hash, self.process_site(hostname)
+            return
+
+        futures = [(hostname, inputs_hash, self.executor.submit(process_site_data, "http://" + hostname,
+                                                                self.result_base_folder))
+                   for hostname, inputs_hash in ready]
+        for hostname, inputs_hash, future in futures:
+            try:
+                yield hostname, inputs_hash, future.result()
+            except Exception as e:
+                print(f"[✗] Could not process {hostname}: {e}")
+                yield hostname, inputs_hash, None
+
+    def process_site(self, hostname):
+        try:
+            return process_site_data("http://" + hostname, self.result_base_folder)
+        except Exception as e:
+            print(f"[✗] Could not process {hostname}: {e}")
+            return None
+
+    # ======
+    # Discovery
+    def find_ready_captures(self):
+        # Yields (hostname, capture version, queue file or None) for captures not handled yet
+        # Queued hostnames are always yielded, so their queue entries are consumed even when
+        # the capture was already seen
+        queued = self.read_queue()
+        for hostname in sorted(set(os.listdir(self.result_base_folder)) | set(queued)):
+            capture_folder = os.path.join(self.result_base_folder, hostname, "capture")
+            if hostname in queued:
+                yield hostname, capture_version(capture_folder) or time.time_ns(), queued[hostname]
+                continue
+            if not os.path.isdir(capture_folder):
+                continue
+            version = capture_version(capture_folder)
+            if version is None or self.seen.get(hostname) == version:
+                continue
+            yield hostname, version, None
+
+    def read_queue(self):
+        # A file named after a hostname asks for its capture to be processed
+        if self.queue_folder is None or not os.path.isdir(self.queue_folder):
+            return {}
+        return {name: os.path.join(self.queue_folder, name)
+                for name in os.listdir(self.queue_folder) if not name.startswith(".")}
+
+    # ======
+    # Aggregate
+    def update_aggregate(self):
+        # Previous site order first, new sites appended
+        hostnames = [hostname for hostname in self.manifest.aggregate if hostname in self.manifest.sites]
+        hostnames += sorted(hostname for hostname in self.manifest.sites if hostname not in hostnames)
+
+        all_custom_headers = []
+        for hostname in hostnames:
+            custom_headers_file = os.path.join(self.result_base_folder, hostname, "pipeline/custom_headers.json")
+            if os.path.exists(custom_headers_file):
+                all_custom_headers.append(read_json(custom_headers_file))
+        save_json(all_custom_headers, os.path.join(self.result_base_folder, "all_custom_headers.json"))
+        self.manifest.record_aggregate(hostnames)
+
+#####################################
+# Helper functions
+#####################################
+def capture_version(capture_folder):
+    # mtime of the completion marker, or None while the capture is still being written
+    marker = os.path.join(capture_folder, CAPTURE_MARKER)
+    if os.path.exists(marker):
+        return os.stat(marker).st_mtime_ns
+
+    try:
+        mtimes = [os.stat(path).st_mtime_ns for path in find_capture_inputs(capture_folder)]
+    except FileNotFoundError:
+        return None
+    if time.time_ns() - max(mtimes) < UNMARKED_STABLE_SECONDS * 1e9:
+        return None
+    return max(mtimes)
+
+#####################################
+# Command line
+#####################################
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Process captures as they are completed.")
+    arg_parser.add_argument("results", nargs="?", default="results")
+    arg_parser.add_argument("--queue", default=None, help="folder of files named after hostnames to process")
+    arg_parser.add_argument("--poll-interval", type=float, default=2.0)
+    arg_parser.add_argument("--workers", type=int, default=1, help="processes used to process sites")
+    args = arg_parser.parse_args()
+
+    CaptureDaemon(args.results, args.queue, args.poll_interval, args.workers).run()
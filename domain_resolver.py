@@ -0,0 +1,52 @@
+import os
+from functools import lru_cache
+
+import tldextract
+from tldextract.remote import lenient_netloc
+
+# Distinct hosts kept in memory; a site's capture only touches a few dozen
+CACHE_SIZE = 4096
+
+#####################################
+# Offline extractor
+#####################################
+def build_extractor(suffix_list_file=None):
+    # Never fetch the public suffix list: use a local snapshot if given, else the bundled one
+    if suffix_list_file:
+        suffix_list_urls = ("file://" + os.path.abspath(suffix_list_file),)
+    else:
+        suffix_list_urls = ()
+    return tldextract.TLDExtract(cache_dir=None, suffix_list_urls=suffix_list_urls, fallback_to_snapshot=True)
+
+extractor = build_extractor(os.environ.get("SUFFIX_LIST_FILE"))
+
+#####################################
+# Domain resolution
+#####################################
+def get_domain(url):
+    try:
+        # Cache by host so every URL of the same host shares one lookup
+        return resolve_host(lenient_netloc(url))
+    except:
+        return "invalid"
+
+@lru_cache(maxsize=CACHE_SIZE)
+def resolve_host(host):
+    return extractor.extract_str(host).top_domain_under_public_suffix
+
+#####################################
+# Cache management
+#####################################
+def domain_cache_info():
+    info = resolve_host.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize
+    }
+
+def set_suffix_list(suffix_list_file):
+    global extractor
+    extractor = build_extractor(suffix_list_file)
+    resolve_host.cache_clear()
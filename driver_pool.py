@@ -0,0 +1,133 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+#####################################
+# Pool of reusable drivers
+#####################################
+class DriverPool:
+    def __init__(self, driver_factory, size, site_timeout=120):
+        self.driver_factory = driver_factory
+        self.size = size
+        self.site_timeout = site_timeout
+
+        # One driver per worker thread, created lazily and reused across sites
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.drivers = []
+
+    # ======
+    # Driver lifecycle
+    def get_driver(self):
+        driver = getattr(self.local, "driver", None)
+        if driver is None:
+            driver = self.driver_factory()
+            try:
+                driver.set_page_load_timeout(self.site_timeout)
+                driver.set_script_timeout(self.site_timeout)
+            except Exception:
+                quit_driver(driver)
+                raise
+            with self.lock:
+                self.drivers.append(driver)
+            self.local.driver = driver
+        return driver
+
+    def discard_driver(self, driver):
+        self.local.driver = None
+        with self.lock:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+        quit_driver(driver)
+
+    def close(self):
+        with self.lock:
+            drivers, self.drivers = self.drivers, []
+        for driver in drivers:
+            quit_driver(driver)
+
+    # ======
+    # Run one site on the worker's driver
+    def run(self, task, url):
+        # A browser that cannot be launched only fails this site, the next one tries again
+        try:
+            driver = self.get_driver()
+        except Exception as e:
+            print(f"[✗] Could not start a browser for {url} — {str(e)}")
+            return False
+        timed_out = threading.Event()
+
+        # A hung site gets its driver killed, which unblocks the worker
+        def kill():
+            timed_out.set()
+            quit_driver(driver)
+
+        timer = threading.Timer(self.site_timeout, kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            result = task(url, driver)
+        except Exception as e:
+            print(f"[✗] Failed: {url} — {str(e)}")
+            result = False
+        finally:
+            timer.cancel()
+
+        if timed_out.is_set():
+            print(f"[✗] Timed out after {self.site_timeout}s: {url}")
+            self.discard_driver(driver)
+            return False
+
+        # Reset instead of relaunching; a driver that cannot be reset is replaced
+        try:
+            reset_driver(driver)
+        except Exception:
+            self.discard_driver(driver)
+        return result
+
+    def map(self, task, urls):
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            futures = {executor.submit(self.run, task, url): url for url in urls}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        return results
+
+#####################################
+# Helper functions
+#####################################
+def reset_driver(driver):
+    # Clear storage of every origin the site used: "*" where Chrome supports it, and each
+    # origin of the frame tree (the page and its third-party iframes) explicitly. Cookies set
+    # along redirects are cleared with the other cookies below.
+    origins = {"*"} | frame_origins(driver.execute_cdp_cmd("Page.getFrameTree", {})["frameTree"])
+    for origin in sorted(origins):
+        try:
+            driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+        except Exception:
+            if origin != "*":
+                raise
+
+    # Clear cookies/cache of every domain and leave the page
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+    driver.get("about:blank")
+
+    # Drop leftover events so they are not attributed to the next site
+    driver.get_log("performance")
+
+def frame_origins(frame_tree):
+    origins = set()
+    stack = [frame_tree]
+    while stack:
+        node = stack.pop()
+        origin = node["frame"].get("securityOrigin")
+        if origin and origin != "null" and origin.startswith(("http://", "https://")):
+            origins.add(origin)
+        stack.extend(node.get("childFrames", []))
+    return origins
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
@@ -0,0 +1,137 @@
+import os
+import json
+import pickle
+import hashlib
+from functools import lru_cache
+
+from manifest import hash_capture_inputs, hash_modules
+from metrics import metrics
+from information_api import read_capture_file, iter_capture_file
+from header_catalog import STANDARD_HEADER_FILES
+from header_analysis import iter_headers, build_header_table
+from storage_matcher import StorageMatcher
+
+FEATURE_CACHE_FOLDER = "feature_cache"
+# Bumped whenever the layout of the cached entries changes, so older entries are ignored
+FEATURE_VERSION = 1
+# Code the cached tables and features are computed with: any change to it is a cache miss
+FEATURE_MODULES = [
+    "domain_resolver.py",
+    "feature_cache.py",
+    "header_analysis.py",
+    "header_catalog.py",
+    "header_dedup.py",
+    "header_table.py",
+    "storage_matcher.py"
+]
+# Least recently used entries are removed above this size
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+#####################################
+# Per-capture feature cache
+#####################################
+class FeatureCache:
+    # Header tables of processed captures with their stateless features (decoded value
+    # lengths, custom, third-party and in-storage masks), one pickle per capture.
+    # Keys hash the capture, the standard header files and the code of the features
+    # (FEATURE_MODULES) but not the heuristics, so changing a threshold or a heuristic keeps
+    # the entries: only the cheap predicates (min length, consistent value) are evaluated again.
+    def __init__(self, folder, max_bytes=MAX_CACHE_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.folder, key + ".pickle")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError, ModuleNotFoundError):
+            # Missing, partial, or pickled with classes that no longer exist
+            return None
+        if entry.get("version") != FEATURE_VERSION:
+            return None
+        # Marks the entry as recently used
+        os.utime(path)
+        return entry["header_table"]
+
+    def put(self, key, header_table):
+        # Written aside then renamed, a concurrent reader never sees half an entry
+        path = self.path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump({"version": FEATURE_VERSION, "header_table": header_table}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for filename in os.listdir(self.folder):
+            if not filename.endswith(".pickle"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, filename))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, filename))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.folder, filename))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+#####################################
+# Loading
+#####################################
+def load_header_table(capture_folder, hostname, default_headers, cache=None):
+    # Header table of a capture with its features: from the cache when the capture, the
+    # standard headers and the feature code are unchanged, otherwise built (and cached)
+    cache_key = None
+    if cache is not None:
+        cache_key = feature_cache_key(capture_folder, STANDARD_HEADER_FILES)
+        with metrics.timer("feature_cache"):
+            header_table = cache.get(cache_key)
+        metrics.count("feature_cache_hits", int(header_table is not None))
+        if header_table is not None:
+            return header_table
+
+    with metrics.timer("capture_read"):
+        storage_values = StorageMatcher(read_capture_file(capture_folder + "/storage_values"))
+    try:
+        headers = iter_capture_file(capture_folder + "/all_headers")
+    except FileNotFoundError:
+        headers = iter_headers(iter_capture_file(capture_folder + "/network_events"), hostname)
+
+    # Duplicate headers are collapsed as they are read, the capture is never loaded whole
+    with metrics.timer("header_table"):
+        header_table = build_header_table(headers)
+        header_table.compute_features(default_headers, storage_values)
+    if cache is not None:
+        with metrics.timer("feature_cache"):
+            cache.put(cache_key, header_table)
+    return header_table
+
+#####################################
+# Helper functions
+#####################################
+def feature_cache_key(capture_folder, standard_header_files):
+    inputs = hash_capture_inputs(capture_folder, standard_header_files)
+    inputs["feature_version"] = FEATURE_VERSION
+    inputs["feature_code"] = hash_feature_code()
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+@lru_cache(maxsize=1)
+def hash_feature_code():
+    return hash_modules(FEATURE_MODULES)
+
+def feature_cache_path(result_base_folder):
+    return os.path.join(result_base_folder, FEATURE_CACHE_FOLDER)
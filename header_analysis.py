@@ -1,13 +1,17 @@
-import tldextract
-
-from pipeline_filtering import heuristics_filtering_pipeline
-from permutation_filtering_stats import permutation_statistics
+from domain_resolver import get_domain
+from pipeline_filtering import heuristics_filtering_pipeline, columnar_filtering_pipeline, FilteringPipeline
+from permutation_filtering_stats import permutation_statistics, columnar_permutation_statistics, PermutationCounter
+from header_table import HeaderTable
+from header_dedup import RequestCorrelator, collapse_request_repeats
 
 #####################################
 # Get ALL headers in network
 #####################################
 def get_headers(events, hostname):
-    all_headers = []
+    return list(iter_headers(events, hostname))
+
+def iter_headers(events, hostname):
+    # Headers one at a time, so events can be streamed without building the whole list
     hostname_domain = get_domain(hostname)
 
     # =======
@@ -34,24 +38,44 @@ def get_headers(events, hostname):
 
         if headers:
             for header_name, header_value in headers.items():
-                all_headers.append({
+                yield {
                     "method": method_type,
                     "header_name": header_name,
                     "header_value": header_value,
                     "host_domain": hostname_domain,
-                    "method_domain": method_domain
-                })
+                    "method_domain": method_domain,
+                    "request_id": params.get("requestId")
+                }
 
-    return all_headers
+#####################################
+# Columnar table of headers
+#####################################
+def build_header_table(all_headers):
+    return HeaderTable(all_headers)
 
 #####################################
 # Get CUSTOM headers through filtering
 #####################################
-def get_custom_headers(all_headers, default_headers, storage_values, pipeline_folder):
+def get_custom_headers(all_headers, default_headers, storage_values, pipeline_folder, order="canonical"):
     # =======
     # Perform custom header extraction
+    # A HeaderTable takes the columnar path, a list of dicts the reference path.
+    # The columnar path only pays off once the table is shared with the permutation stats
+    # or cached. Median times on the bundled captures, table built from scratch:
+    #   pipeline only     bbcamerica 2097 headers: 10.8ms row-wise, 16.0ms columnar
+    #                     planfix    3282 headers:  6.8ms row-wise, 16.7ms columnar
+    #   pipeline + stats  bbcamerica: 34.5ms row-wise, 18.6ms columnar (4.2ms cached table)
+    #                     planfix:    40.4ms row-wise, 16.9ms columnar (4.3ms cached table)
+    # Below ~200 headers both are within 1ms. The table also peaks higher (planfix: 360KiB
+    # against 134KiB). process_site uses it anyway, as it always computes both outputs.
+    # `order` only changes evaluation order, removals are reported in canonical order.
+    # Both paths count the headers re-sent within a request once.
+    if isinstance(all_headers, HeaderTable):
+        return columnar_filtering_pipeline(
+            all_headers, default_headers, storage_values, pipeline_folder, order
+        )
     custom_headers, standard_headers = heuristics_filtering_pipeline(
-        all_headers, default_headers, storage_values, pipeline_folder
+        collapse_request_repeats(all_headers), default_headers, storage_values, pipeline_folder, order
     )
     return custom_headers, standard_headers
 
@@ -61,15 +85,34 @@ def get_custom_headers(all_headers, default_headers, storage_values, pipeline_fo
 def get_filtering_permutation_stats(all_headers, default_headers, storage_values, stats_folder):
     # =======
     # Get statistics
+    if isinstance(all_headers, HeaderTable):
+        columnar_permutation_statistics(
+            all_headers, default_headers, storage_values, stats_folder
+        )
+        return
     permutation_statistics(
-        all_headers, default_headers, storage_values, stats_folder
+        collapse_request_repeats(all_headers), default_headers, storage_values, stats_folder
     )
 
 #####################################
-# Helper Functions
+# Streaming: custom headers and stats in one pass
 #####################################
-def get_domain(url):
-    try:
-        return tldextract.extract(url).top_domain_under_public_suffix
-    except:
-        return "invalid"
\ No newline at end of file
+def stream_custom_headers(headers, default_headers, storage_values, pipeline_folder, stats_folder,
+                          sink=None, order="canonical"):
+    # headers can be any iterable (e.g. iter_headers over streamed events): each header goes
+    # to the optional sink (all_headers file), the pipeline and the permutation counters,
+    # and is then dropped. The sink gets every header, the filters only one per request.
+    pipeline = FilteringPipeline(default_headers, storage_values, order)
+    counter = PermutationCounter(default_headers, storage_values)
+    correlator = RequestCorrelator()
+    for header in headers:
+        if sink is not None:
+            sink.write(header)
+        if correlator.is_repeat(header):
+            continue
+        pipeline.add(header)
+        counter.add(header)
+
+    custom_headers, standard_headers = pipeline.finish(pipeline_folder)
+    counter.finish(stats_folder)
+    return custom_headers, standard_headers, counter.n_headers
@@ -0,0 +1,154 @@
+import os
+import re
+import pickle
+import fnmatch
+import hashlib
+from functools import lru_cache
+
+from manifest import hash_modules
+
+# Marks the end of a rule in a trie node
+END = ""
+
+# Bumped whenever HeaderCatalog changes, so older compiled catalogs are ignored
+CATALOG_FORMAT = 1
+CATALOG_EXTENSION = ".catalog"
+
+# Rule files of the standard header catalog: the generated list of standard headers, and the
+# hand-maintained families of standard/infrastructure headers (prefixes, suffixes, wildcards)
+STANDARD_HEADERS_FILE = "standard_headers.txt"
+STANDARD_PATTERNS_FILE = "standard_header_patterns.txt"
+STANDARD_HEADER_FILES = [STANDARD_HEADERS_FILE, STANDARD_PATTERNS_FILE]
+
+#####################################
+# Standard header catalog
+#####################################
+class HeaderCatalog:
+    # Case-insensitive set of standard headers: exact names, "prefix-*" and "*-suffix"
+    # rules (tries, walked once along the name) and other wildcards (one combined regex).
+    # `name in catalog` replaces the lookup in the plain set of standard headers.
+    def __init__(self, rules=()):
+        self.exact = set()
+        self.prefixes = {}
+        self.suffixes = {}
+        self.globs = []
+        for rule in rules:
+            self.add(rule)
+        self.compile()
+
+    def add(self, rule):
+        rule = rule.strip().lower()
+        if not rule:
+            return
+        if "*" not in rule:
+            self.exact.add(rule)
+        elif rule.endswith("*") and "*" not in rule[:-1]:
+            insert_rule(self.prefixes, rule[:-1])
+        elif rule.startswith("*") and "*" not in rule[1:]:
+            insert_rule(self.suffixes, rule[:0:-1])
+        else:
+            self.globs.append(rule)
+
+    def compile(self):
+        self.glob_pattern = None
+        if self.globs:
+            self.glob_pattern = re.compile("|".join(fnmatch.translate(glob) for glob in self.globs))
+
+    def __contains__(self, name):
+        key = name.lower()
+        if key in self.exact:
+            return True
+        if match_rule(self.prefixes, key) or match_rule(self.suffixes, reversed(key)):
+            return True
+        return self.glob_pattern is not None and self.glob_pattern.match(key) is not None
+
+    def __len__(self):
+        return len(self.exact)
+
+    def __iter__(self):
+        return iter(self.exact)
+
+#####################################
+# Loading
+#####################################
+def load_header_catalog(*filenames):
+    # One catalog per process, rebuilt only when one of the files changes
+    versions = []
+    for filename in filenames:
+        stat = os.stat(filename)
+        versions.append((os.path.abspath(filename), stat.st_mtime_ns, stat.st_size))
+    return load_header_catalog_version(tuple(versions))
+
+@lru_cache(maxsize=4)
+def load_header_catalog_version(versions):
+    filenames = [filename for filename, _, _ in versions]
+    catalog = load_compiled_catalog(compiled_catalog_path(filenames), filenames)
+    if catalog is not None:
+        return catalog
+
+    rules = []
+    for filename in filenames:
+        rules += read_rules(filename)
+    return HeaderCatalog(rules)
+
+def read_rules(filename):
+    with open(filename, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+# ======
+# Compiled catalog (built by standardHeadersFileGenerator.py)
+def compiled_catalog_path(filenames):
+    return os.path.splitext(filenames[0])[0] + CATALOG_EXTENSION
+
+def save_compiled_catalog(catalog, path, filenames):
+    with open(path, "wb") as f:
+        pickle.dump({
+            "format": CATALOG_FORMAT,
+            "code": hash_catalog_code(),
+            "sources": [hash_rules_file(filename) for filename in filenames],
+            "catalog": catalog
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_compiled_catalog(path, filenames):
+    # None when missing, unreadable, or built from other versions of the rule files or of
+    # this module
+    try:
+        with open(path, "rb") as f:
+            compiled = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError, ModuleNotFoundError):
+        return None
+    if not isinstance(compiled, dict):
+        return None
+    if compiled.get("format") != CATALOG_FORMAT or compiled.get("code") != hash_catalog_code():
+        return None
+    if compiled.get("sources") != [hash_rules_file(filename) for filename in filenames]:
+        return None
+    return compiled["catalog"]
+
+#####################################
+# Helper functions
+#####################################
+@lru_cache(maxsize=1)
+def hash_catalog_code():
+    return hash_modules(["header_catalog.py"])
+
+def hash_rules_file(filename):
+    with open(filename, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def insert_rule(trie, chars):
+    node = trie
+    for char in chars:
+        node = node.setdefault(char, {})
+    node[END] = True
+
+def match_rule(trie, chars):
+    # True if a rule of the trie is a prefix of chars
+    node = trie
+    for char in chars:
+        if END in node:
+            return True
+        node = node.get(char)
+        if node is None:
+            return False
+    return END in node
@@ -0,0 +1,83 @@
+# Headers re-sent under the same requestId (the hops of a redirect chain, which Chrome
+# reports under the requestId of the original request) count once per request
+COLLAPSE_REQUEST_REPEATS = True
+
+#####################################
+# Deduplicated headers
+#####################################
+class HeaderDedupIndex:
+    # Collapses identical headers (same method, name, value and domains, e.g. repeated
+    # beacons) into one row with its number of occurrences. Rows keep the order of their
+    # first occurrence, and remember every position for the outputs.
+    # Repeats within one request are dropped first (see RequestCorrelator).
+    def __init__(self, headers=(), collapse_requests=COLLAPSE_REQUEST_REPEATS):
+        self.rows = []
+        self.counts = []
+        self.positions = []
+        self.keys = {}
+        self.correlator = RequestCorrelator(collapse_requests)
+        self.n_headers = 0
+        for header in headers:
+            self.add(header)
+
+    def add(self, header):
+        key = header_key(header)
+        if self.correlator.is_repeat(header, key):
+            return self.keys[key]
+
+        row = self.keys.get(key)
+        if row is None:
+            row = self.keys[key] = len(self.rows)
+            self.rows.append(header)
+            self.counts.append(0)
+            self.positions.append([])
+        self.counts[row] += 1
+        self.positions[row].append(self.n_headers)
+        self.n_headers += 1
+        return row
+
+    def compact(self):
+        # Drops the lookups once every header is added (e.g. before the table is cached)
+        self.n_request_repeats = self.correlator.n_repeats
+        self.keys = None
+        self.correlator = None
+
+    def __len__(self):
+        return len(self.rows)
+
+#####################################
+# Request/response correlation
+#####################################
+class RequestCorrelator:
+    # requestId -> keys of the request and response headers already seen for it.
+    # A redirect chain keeps its requestId and re-sends most of its headers at every hop;
+    # with collapse on, those repeats are reported so they count as one header.
+    def __init__(self, collapse=COLLAPSE_REQUEST_REPEATS):
+        self.collapse = collapse
+        self.requests = {}
+        self.n_repeats = 0
+
+    def is_repeat(self, header, key=None):
+        request_id = header.get("request_id")
+        if request_id is None:
+            return False
+        request_keys = self.requests.setdefault(request_id, set())
+        if key is None:
+            key = header_key(header)
+        if key in request_keys:
+            self.n_repeats += 1
+            return self.collapse
+        request_keys.add(key)
+        return False
+
+#####################################
+# Helper functions
+#####################################
+def header_key(header):
+    return (header["method"], header["header_name"], header["header_value"],
+            header["host_domain"], header["method_domain"])
+
+def collapse_request_repeats(headers, collapse=COLLAPSE_REQUEST_REPEATS):
+    # Same collapse as HeaderDedupIndex for the row-wise and streaming paths
+    correlator = RequestCorrelator(collapse)
+    return (header for header in headers if not correlator.is_repeat(header))
@@ -0,0 +1,207 @@
+import os
+import sys
+import sqlite3
+import argparse
+
+from information_api import read_json
+from manifest import Manifest
+
+INDEX_FILE = "header_index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sites (
+    hostname TEXT PRIMARY KEY,
+    inputs_hash TEXT,
+    num_headers INTEGER
+);
+CREATE TABLE IF NOT EXISTS headers (
+    hostname TEXT NOT NULL REFERENCES sites(hostname),
+    method TEXT,
+    header_name TEXT,
+    name TEXT,
+    header_value TEXT,
+    host_domain TEXT,
+    method_domain TEXT
+);
+CREATE INDEX IF NOT EXISTS headers_hostname ON headers(hostname);
+CREATE INDEX IF NOT EXISTS headers_name ON headers(name);
+CREATE INDEX IF NOT EXISTS headers_method_domain ON headers(method_domain);
+CREATE INDEX IF NOT EXISTS headers_host_domain ON headers(host_domain);
+"""
+
+#####################################
+# Index of custom headers across sites
+#####################################
+class HeaderIndex:
+    # SQLite index of every site's custom headers. Names are compared lowercased;
+    # a site is replaced as a whole when it is processed again.
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # ======
+    # Updates
+    def is_current(self, hostname, inputs_hash):
+        row = self.connection.execute("SELECT inputs_hash FROM sites WHERE hostname = ?", (hostname,)).fetchone()
+        return row is not None and row[0] == inputs_hash
+
+    def update_site(self, hostname, custom_headers, inputs_hash=None, num_headers=None):
+        with self.connection:
+            self.connection.execute("DELETE FROM headers WHERE hostname = ?", (hostname,))
+            self.connection.execute("INSERT OR REPLACE INTO sites VALUES (?, ?, ?)", (hostname, inputs_hash, num_headers))
+            self.connection.executemany(
+                "INSERT INTO headers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((hostname, header["method"], header["header_name"], header["header_name"].lower(),
+                  header["header_value"], header["host_domain"], header["method_domain"])
+                 for header in custom_headers or []))
+
+    def remove_site(self, hostname):
+        with self.connection:
+            self.connection.execute("DELETE FROM headers WHERE hostname = ?", (hostname,))
+            self.connection.execute("DELETE FROM sites WHERE hostname = ?", (hostname,))
+
+    def rebuild(self, result_base_folder):
+        # Index every processed site of a results folder, with its inputs hash and number of
+        # headers from the manifest, and drop the sites that are no longer there
+        manifest_sites = Manifest(result_base_folder).sites
+        hostnames = set()
+        for hostname in sorted(os.listdir(result_base_folder)):
+            custom_headers_file = os.path.join(result_base_folder, hostname, "pipeline/custom_headers.json")
+            if os.path.exists(custom_headers_file):
+                entry = manifest_sites.get(hostname, {})
+                self.update_site(hostname, read_json(custom_headers_file),
+                                 entry.get("inputs_hash"), entry.get("num_headers"))
+                hostnames.add(hostname)
+
+        for (hostname,) in self.connection.execute("SELECT hostname FROM sites").fetchall():
+            if hostname not in hostnames:
+                self.remove_site(hostname)
+        return len(hostnames)
+
+    # ======
+    # Queries
+    def query(self, sql, parameters=()):
+        cursor = self.connection.execute(sql, parameters)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def sites(self):
+        return self.query("SELECT hostname, num_headers, (SELECT COUNT(*) FROM headers h WHERE h.hostname = s.hostname)"
+                          " AS custom_headers FROM sites s ORDER BY hostname")
+
+    def top_headers(self, k=20, method=None):
+        # Custom header names found on the most sites
+        return self.query(
+            "SELECT name, COUNT(DISTINCT hostname) AS sites, COUNT(*) AS occurrences,"
+            " COUNT(DISTINCT method_domain) AS domains FROM headers"
+            " WHERE (? IS NULL OR method = ?)"
+            " GROUP BY name ORDER BY sites DESC, occurrences DESC, name LIMIT ?",
+            (method, method, k))
+
+    def top_domains(self, k=20):
+        # Domains sending or receiving custom headers on the most sites
+        return self.query(
+            "SELECT method_domain, COUNT(DISTINCT hostname) AS sites, COUNT(DISTINCT name) AS names,"
+            " COUNT(*) AS occurrences FROM headers"
+            " GROUP BY method_domain ORDER BY sites DESC, occurrences DESC, method_domain LIMIT ?",
+            (k,))
+
+    def header_breakdown(self, name):
+        # Domains that a header name is exchanged with, and on how many sites
+        return self.query(
+            "SELECT method_domain, method, COUNT(DISTINCT hostname) AS sites, COUNT(*) AS occurrences"
+            " FROM headers WHERE name = ?"
+            " GROUP BY method_domain, method ORDER BY sites DESC, occurrences DESC, method_domain",
+            (name.lower(),))
+
+    def domain_breakdown(self, method_domain):
+        # Header names exchanged with a domain, and on how many sites
+        return self.query(
+            "SELECT name, method, COUNT(DISTINCT hostname) AS sites, COUNT(*) AS occurrences"
+            " FROM headers WHERE method_domain = ?"
+            " GROUP BY name, method ORDER BY sites DESC, occurrences DESC, name",
+            (method_domain,))
+
+    def co_occurrence(self, name=None, k=20):
+        # Pairs of header names found on the same sites (with `name`, only its pairs)
+        return self.query(
+            "WITH site_names AS (SELECT DISTINCT hostname, name FROM headers)"
+            " SELECT a.name AS name, b.name AS other, COUNT(*) AS sites"
+            " FROM site_names a JOIN site_names b ON a.hostname = b.hostname AND a.name < b.name"
+            " WHERE (? IS NULL OR a.name = ? OR b.name = ?)"
+            " GROUP BY a.name, b.name ORDER BY sites DESC, a.name, b.name LIMIT ?",
+            (name and name.lower(),) * 3 + (k,))
+
+#####################################
+# Helper functions
+#####################################
+def index_path(result_base_folder):
+    return os.path.join(result_base_folder, INDEX_FILE)
+
+def print_rows(rows):
+    if not rows:
+        print("(no results)")
+        return
+    columns = list(rows[0])
+    widths = [max(len(str(column)), *(len(str(row[column])) for row in rows)) for column in columns]
+    print("  ".join(str(column).ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[column]).ljust(width) for column, width in zip(columns, widths)))
+
+#####################################
+# Command line
+#####################################
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Query the custom headers of all processed sites.")
+    arg_parser.add_argument("--results", default="results")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    top_command = commands.add_parser("top", help="header names found on the most sites")
+    top_command.add_argument("-k", type=int, default=20)
+    top_command.add_argument("--method", choices=["REQUEST", "RESPONSE"])
+
+    domains_command = commands.add_parser("domains", help="domains exchanging custom headers on the most sites")
+    domains_command.add_argument("-k", type=int, default=20)
+
+    header_command = commands.add_parser("header", help="domains a header name is exchanged with")
+    header_command.add_argument("name")
+
+    domain_command = commands.add_parser("domain", help="header names exchanged with a domain")
+    domain_command.add_argument("domain")
+
+    cooccur_command = commands.add_parser("cooccur", help="header names found on the same sites")
+    cooccur_command.add_argument("name", nargs="?")
+    cooccur_command.add_argument("-k", type=int, default=20)
+
+    commands.add_parser("sites", help="indexed sites")
+    commands.add_parser("rebuild", help="index every processed site of the results folder")
+
+    args = arg_parser.parse_args()
+    with HeaderIndex(index_path(args.results)) as index:
+        if args.command == "rebuild":
+            print(f"[✓] Indexed {index.rebuild(args.results)} sites")
+            sys.exit(0)
+
+        if args.command == "top":
+            rows = index.top_headers(args.k, args.method)
+        elif args.command == "domains":
+            rows = index.top_domains(args.k)
+        elif args.command == "header":
+            rows = index.header_breakdown(args.name)
+        elif args.command == "domain":
+            rows = index.domain_breakdown(args.domain)
+        elif args.command == "cooccur":
+            rows = index.co_occurrence(args.name, args.k)
+        else:
+            rows = index.sites()
+        print_rows(rows)
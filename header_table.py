@@ -0,0 +1,170 @@
+import urllib.parse
+
+from header_dedup import HeaderDedupIndex
+
+#####################################
+# Columnar header table
+#####################################
+class HeaderTable:
+    # Headers are stored column by column. Names, values and domains are interned into
+    # categories, so a heuristic is evaluated once per distinct category and then
+    # gathered into a row bitmask (bit i set = row i kept).
+    # Rows are the deduplicated headers; statistics weight each row by its occurrences.
+    def __init__(self, all_headers):
+        index = all_headers if isinstance(all_headers, HeaderDedupIndex) else HeaderDedupIndex(all_headers)
+        index.compact()
+        self.index = index
+        self.headers = index.rows
+        self.n_rows = len(index.rows)
+        self.n_headers = index.n_headers
+        self.all_rows = (1 << self.n_rows) - 1
+
+        self.names, self.name_codes = intern_column(h["header_name"] for h in self.headers)
+        self.values, self.value_codes = intern_column(h["header_value"] for h in self.headers)
+        self.domains, self.domain_pair_codes = intern_column(
+            (h["host_domain"], h["method_domain"]) for h in self.headers)
+
+        # One mask per distinct number of occurrences, for weighted counts
+        weight_rows = {}
+        for row, weight in enumerate(index.counts):
+            weight_rows.setdefault(weight, []).append(row)
+        self.weight_masks = [(weight, rows_to_mask(rows, self.n_rows)) for weight, rows in weight_rows.items()]
+
+        # Precomputed per distinct value
+        self.value_lengths = [len(urllib.parse.unquote(value)) for value in self.values]
+
+        # Full-table masks of the stateless features, filled by compute_features (and kept
+        # with the table in the feature cache)
+        self.features = {}
+
+    def compute_features(self, known_standard_headers, storage_values):
+        self.features = {}
+        self.features = {
+            "custom": self.custom_mask(known_standard_headers),
+            "third_party": self.third_party_mask(),
+            "in_storage": self.in_storage_mask(storage_values)
+        }
+        return self
+
+    # ======
+    # Column operations
+    def gather(self, category_flags, codes):
+        # One flag per category -> row bitmask
+        chars = ["1" if flag else "0" for flag in category_flags]
+        column = "".join(map(chars.__getitem__, reversed(codes)))
+        return int(column, 2) if column else 0
+
+    def category_mask(self, categories, codes, predicate, reach=None):
+        # Evaluates predicate once per category; when only a few rows are still in reach,
+        # only the categories present in those rows are evaluated
+        if reach is None:
+            reach = self.all_rows
+        if reach == self.all_rows or count_rows(reach) >= len(categories):
+            flags = [predicate(category) for category in categories]
+        else:
+            flags = [False] * len(categories)
+            for code in {codes[row] for row in iter_rows(reach)}:
+                flags[code] = predicate(categories[code])
+        return self.gather(flags, codes) & reach
+
+    def feature_mask(self, feature, reach=None):
+        mask = self.features[feature]
+        return mask if reach is None else mask & reach
+
+    def custom_mask(self, known_standard_headers, reach=None):
+        if "custom" in self.features:
+            return self.feature_mask("custom", reach)
+        return self.category_mask(self.names, self.name_codes,
+                                  lambda name: name.lower() not in known_standard_headers, reach)
+
+    def third_party_mask(self, reach=None):
+        if "third_party" in self.features:
+            return self.feature_mask("third_party", reach)
+        return self.category_mask(self.domains, self.domain_pair_codes,
+                                  lambda domains: domains[0] != domains[1], reach)
+
+    def min_length_mask(self, min_length=8, reach=None):
+        lengths = self.value_lengths
+        return self.category_mask(range(len(self.values)), self.value_codes,
+                                  lambda code: lengths[code] >= min_length, reach)
+
+    def in_storage_mask(self, storage_values, reach=None):
+        if "in_storage" in self.features:
+            return self.feature_mask("in_storage", reach)
+        return self.category_mask(self.values, self.value_codes,
+                                  lambda value: value in storage_values, reach)
+
+    def consistent_mask(self, reach):
+        # Order dependent: the first value seen for a name among the reaching rows wins
+        seen_values = {}
+        kept_rows = []
+        for row in iter_rows(reach):
+            value_code = self.value_codes[row]
+            if seen_values.setdefault(self.name_codes[row], value_code) == value_code:
+                kept_rows.append(row)
+        return rows_to_mask(kept_rows, self.n_rows)
+
+    def single_value_mask(self, reach):
+        # Stricter variant: names seen with more than one value among the reaching rows are
+        # dropped entirely
+        name_values = {}
+        for row in iter_rows(reach):
+            name_values.setdefault(self.name_codes[row], set()).add(self.value_codes[row])
+        kept_rows = [row for row in iter_rows(reach) if len(name_values[self.name_codes[row]]) == 1]
+        return rows_to_mask(kept_rows, self.n_rows)
+
+    # ======
+    # Row access
+    def count(self, mask):
+        # Number of headers (occurrences) in the rows of mask
+        return sum(weight * count_rows(mask & weight_mask) for weight, weight_mask in self.weight_masks)
+
+    def rows(self, mask):
+        # Distinct headers of mask
+        return [self.headers[row] for row in iter_rows(mask)]
+
+    def occurrences(self, mask):
+        # Every occurrence of the rows of mask, in capture order
+        positions = sorted((position, row) for row in iter_rows(mask) for position in self.index.positions[row])
+        return [self.headers[row] for _, row in positions]
+
+    def count_names(self, mask):
+        # Occurrences per lowercase name, in order of first appearance
+        counts = {}
+        weights = self.index.counts
+        for row in iter_rows(mask):
+            key = self.names[self.name_codes[row]].lower()
+            counts[key] = counts.get(key, 0) + weights[row]
+        return counts
+
+#####################################
+# Helper functions
+#####################################
+def intern_column(values):
+    categories = []
+    codes = []
+    index = {}
+    for value in values:
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(categories)
+            categories.append(value)
+        codes.append(code)
+    return categories, codes
+
+def iter_rows(mask):
+    # Indices of the set bits, lowest first
+    bits = bin(mask)[:1:-1]
+    row = bits.find("1")
+    while row != -1:
+        yield row
+        row = bits.find("1", row + 1)
+
+def rows_to_mask(rows, n_rows):
+    flags = bytearray((n_rows + 7) // 8)
+    for row in rows:
+        flags[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(flags, "little")
+
+def count_rows(mask):
+    return mask.bit_count()
@@ -0,0 +1,159 @@
+import urllib.parse
+
+# Minimum decoded length of a custom header value (heuristic 2)
+MIN_VALUE_LENGTH = 8
+
+#####################################
+# Registry
+#####################################
+class Heuristic:
+    # check(header, context, state)      -> True if the header is kept (reference path)
+    # column(table, context, reach)      -> bitmask of kept rows within reach (columnar path)
+    # stateful heuristics depend on the headers that reached them, so they are never
+    # reordered; cost is a relative per-header cost and selectivity the expected
+    # fraction of headers removed, both used to order the production pipeline.
+    def __init__(self, name, pipeline_key, check, column, stateful=False, cost=1.0, selectivity=0.5,
+                 preprocessing=False):
+        self.name = name
+        self.pipeline_key = pipeline_key
+        self.check = check
+        self.column = column
+        self.stateful = stateful
+        self.cost = cost
+        self.selectivity = selectivity
+        self.preprocessing = preprocessing
+
+    def __repr__(self):
+        return f"Heuristic({self.name})"
+
+def build_context(known_standard_headers, storage_values, min_value_length=MIN_VALUE_LENGTH):
+    return {
+        "known_standard_headers": known_standard_headers,
+        "storage_values": storage_values,
+        "min_value_length": min_value_length
+    }
+
+#####################################
+# Heuristics/Filters
+#####################################
+def check_if_custom_header(name, set_standard_headers, seen_standard_headers):
+    key = name.lower()
+
+    # The header is a standard header
+    if key in set_standard_headers:
+        if key in seen_standard_headers:
+            seen_standard_headers[key] += 1
+        else:
+            seen_standard_headers[key] = 1
+        return seen_standard_headers, 0
+
+    # The header is a custom header
+    return seen_standard_headers, 1
+
+def check_if_third_party_associated(url, hostname):
+    return url != hostname #returns true if they are different
+
+def check_if_min_value_length(value, min_length=MIN_VALUE_LENGTH):
+    return len(urllib.parse.unquote(value)) >= min_length #returns true if length is at least min_length
+
+def check_if_consistent_value(name, value, seen_headers):
+    if name in seen_headers:
+        if seen_headers[name] != value:
+            return seen_headers, 0
+    else:
+        seen_headers[name] = value
+    return seen_headers, 1
+
+def check_if_in_storage(value, set):
+    if value in set:
+        return 1
+    return 0
+
+# ======
+# Registry entries, in canonical order
+HEURISTICS = [
+    # Preprocessing: standard header check (state counts the standard headers seen)
+    Heuristic(
+        "standard_headers", "standard_headers",
+        check=lambda header, context, state: check_if_custom_header(
+            header["header_name"], context["known_standard_headers"], state)[1],
+        column=lambda table, context, reach: table.custom_mask(context["known_standard_headers"], reach),
+        cost=1.0, selectivity=0.93, preprocessing=True
+    ),
+    # Heuristic 1: Third-party association
+    Heuristic(
+        "third_party", "third_party",
+        check=lambda header, context, state: check_if_third_party_associated(
+            header["method_domain"], header["host_domain"]),
+        column=lambda table, context, reach: table.third_party_mask(reach),
+        cost=0.5, selectivity=0.25
+    ),
+    # Heuristic 2: Minimum value length
+    Heuristic(
+        "min_length", "min_length",
+        check=lambda header, context, state: check_if_min_value_length(
+            header["header_value"], context["min_value_length"]),
+        column=lambda table, context, reach: table.min_length_mask(context["min_value_length"], reach),
+        cost=3.0, selectivity=0.3
+    ),
+    # Heuristic 3: Consistent value
+    Heuristic(
+        "consistent", "inconsistent",
+        check=lambda header, context, state: check_if_consistent_value(
+            header["header_name"], header["header_value"], state)[1],
+        column=lambda table, context, reach: table.consistent_mask(reach),
+        stateful=True, cost=1.5, selectivity=0.45
+    ),
+    # Heuristic 4: Stored in cookies/local
+    Heuristic(
+        "not_in_storage", "not_in_storage",
+        check=lambda header, context, state: check_if_in_storage(
+            header["header_value"], context["storage_values"]),
+        column=lambda table, context, reach: table.in_storage_mask(context["storage_values"], reach),
+        cost=2.0, selectivity=0.93
+    )
+]
+
+#####################################
+# Ordering
+#####################################
+def get_heuristics(order="canonical", include_preprocessing=True, heuristics=None):
+    # "canonical": registry order, used for every report.
+    # "selectivity": cheap, highly selective heuristics first. Only heuristics between two
+    # stateful ones are reordered, so each stateful heuristic sees the same headers and
+    # the surviving headers are identical to the canonical order.
+    if heuristics is None:
+        heuristics = HEURISTICS
+    heuristics = [h for h in heuristics if include_preprocessing or not h.preprocessing]
+    if order == "canonical":
+        return heuristics
+    if order != "selectivity":
+        raise ValueError(f"Unknown heuristic order: {order}")
+
+    ordered = []
+    segment = []
+    for heuristic in heuristics:
+        if heuristic.stateful:
+            ordered += sorted(segment, key=selectivity_rank)
+            ordered.append(heuristic)
+            segment = []
+        else:
+            segment.append(heuristic)
+    ordered += sorted(segment, key=selectivity_rank)
+    return ordered
+
+def selectivity_rank(heuristic):
+    # Expected cost paid per header removed
+    return heuristic.cost / max(heuristic.selectivity, 1e-9)
+
+def canonical_predecessors(heuristics, ordered):
+    # For each heuristic, the canonical predecessors that are evaluated after it in `ordered`.
+    # Headers it removes are attributed to the first of those that also removes them.
+    position = {heuristic.name: i for i, heuristic in enumerate(ordered)}
+    predecessors = {}
+    for i, heuristic in enumerate(heuristics):
+        predecessors[heuristic.name] = [
+            earlier for earlier in heuristics[:i]
+            if position[earlier.name] > position[heuristic.name]
+        ]
+    return predecessors
@@ -1,6 +1,8 @@
 import os
 import json
 
+from capture_format import save_capture, read_capture, iter_capture, CaptureWriter, EXTENSION
+
 def read_json(path):
     with open(path, "r") as f:
         return json.load(f)
@@ -12,6 +14,71 @@ def save_json(data, path):
             data = list(data)
         json.dump(data, f, indent=2)
 
+def save_capture_file(data, path, capture_format="binary"):
+    # path has no extension, it is added according to the format
+    if capture_format == "json":
+        save_json(data, path + ".json")
+    else:
+        save_capture(data, path + EXTENSION)
+
+def find_capture_file(path):
+    for extension in (EXTENSION, ".json"):
+        if os.path.exists(path + extension):
+            return path + extension
+    raise FileNotFoundError(f"No capture file for {path}")
+
+def read_capture_file(path):
+    found = find_capture_file(path)
+    if found.endswith(EXTENSION):
+        return read_capture(found)
+    return read_json(found)
+
+def iter_capture_file(path):
+    # Binary captures are streamed record by record, JSON ones are loaded whole
+    found = find_capture_file(path)
+    if found.endswith(EXTENSION):
+        return iter_capture(found)
+    return iter(read_json(found))
+
+def open_capture_list(path, capture_format="binary"):
+    # Writer of a list capture, one record at a time
+    if capture_format == "json":
+        return JsonListWriter(path + ".json")
+    return CaptureWriter(path + EXTENSION)
+
+class JsonListWriter:
+    # Streams a list to a file laid out exactly like save_json. Written aside and renamed on
+    # close, like CaptureWriter: a failed capture never leaves a truncated list in place
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.temp_path = f"{path}.{os.getpid()}.tmp"
+        self.file = open(self.temp_path, "w")
+        self.n_records = 0
+
+    def write(self, record):
+        text = json.dumps(record, indent=2).replace("\n", "\n  ")
+        self.file.write(("[\n  " if self.n_records == 0 else ",\n  ") + text)
+        self.n_records += 1
+
+    def close(self):
+        self.file.write("\n]" if self.n_records else "[]")
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
 def load_standard_headers(filename):
     with open(filename, "r", encoding="utf-8") as f:
         headers = {line.strip().lower() for line in f if line.strip()}
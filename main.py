@@ -1,9 +1,10 @@
 # General
 import os
-import json
 import time
+import threading
+import argparse
 import urllib.parse
-from operator import truediv
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Selenium
 from selenium import webdriver
@@ -13,22 +14,67 @@ from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 from webdriver_manager.chrome import ChromeDriverManager
 
 # Mine
-from information_api import read_json, save_json, load_standard_headers
-from parser import extract_all_cookie_values, parse_nested_json, extract_all_storage_values
-from header_analysis import get_custom_headers, get_headers, get_filtering_permutation_stats
+from information_api import (
+    read_json, save_json, save_capture_file, read_capture_file, find_capture_file,
+    iter_capture_file, open_capture_list
+)
+from parser import extract_capture_values, parse_nested_json
+from header_analysis import (
+    get_custom_headers, iter_headers, get_filtering_permutation_stats, stream_custom_headers
+)
+from driver_pool import DriverPool
+from network_log import NetworkEventCollector
+from storage_matcher import StorageMatcher
+from manifest import Manifest, hash_filter_config, hash_site_inputs
+from feature_cache import FeatureCache, feature_cache_path, load_header_table
+from result_writer import ResultWriter, save_result, wait_for_flush, wait_for_flushes
+from header_index import HeaderIndex, index_path
+from header_catalog import load_header_catalog, STANDARD_HEADER_FILES
+from metrics import metrics, run_with_metrics, file_size, metrics_file
+
+# Evaluation order of the heuristics (reports are always in canonical order)
+HEURISTIC_ORDER = "selectivity"
 
 # =====================
 # Helper functions
 # =====================
-def visit_url(driver, url, wait_time=20):
+def visit_url(driver, url, collector, quiet_window=2.0, max_wait=20, poll_interval=0.5):
     # driver.delete_all_cookies()
+    start = time.monotonic()
     try:
-        time.sleep(1)  # Allow browser to settle
-        driver.get(url)
+        with metrics.timer("page_load"):
+            driver.get(url)
     except Exception as e:
         print("[✗] Could not load:", url)
         print("    Error:", str(e))
-    time.sleep(wait_time)
+
+    # Wait until no new request has been sent for quiet_window seconds
+    with metrics.timer("settle"):
+        reached_ceiling = wait_for_network_idle(driver, collector, quiet_window, max_wait, poll_interval)
+    settle_time = time.monotonic() - start
+
+    timing = {
+        "settle_seconds": round(settle_time, 3),
+        "reached_ceiling": reached_ceiling
+    }
+    return timing
+
+def wait_for_network_idle(driver, collector, quiet_window, max_wait, poll_interval):
+    # The collector keeps the drained events, so polling never loses any
+    start = time.monotonic()
+    last_request = start
+
+    while True:
+        new_requests = collector.drain(driver)
+        now = time.monotonic()
+        if new_requests:
+            last_request = now
+
+        if now - last_request >= quiet_window:
+            return False
+        if now - start >= max_wait:
+            return True
+        time.sleep(poll_interval)
 
 def get_hostname(url):
     try:
@@ -37,149 +83,343 @@ def get_hostname(url):
         return "invalid"
 
 def extract_network_events(logs):
-    events = []
-    for entry in logs:
-        try:
-            message = json.loads(entry["message"])["message"]
-            if message["method"] in ["Network.requestWillBeSent", "Network.responseReceived"]:
-                events.append(message)
-        except (json.JSONDecodeError, KeyError):
-            continue
-    return events
+    collector = NetworkEventCollector()
+    collector.ingest(logs)
+    return collector.events
 
 def get_storage_information(driver):
-    # Define set to store values
-    storage_values = set()
-
     # Values in cookies/local/session storage
     cookies = driver.get_cookies()
-    local_storage = parse_nested_json(driver.execute_script("return {...localStorage}"))
-    session_storage = parse_nested_json(driver.execute_script("return {...sessionStorage}"))
+    json_cache = {}
+    local_storage = parse_nested_json(driver.execute_script("return {...localStorage}"), cache=json_cache)
+    session_storage = parse_nested_json(driver.execute_script("return {...sessionStorage}"), cache=json_cache)
 
-    # Update set with values
-    storage_values.update(extract_all_cookie_values(cookies))
-    storage_values.update(extract_all_storage_values(local_storage))
-    storage_values.update(extract_all_storage_values(session_storage))
+    # Set of candidate values, extracted in one pass
+    storage_values = extract_capture_values(cookies, local_storage, session_storage)
 
     return storage_values, cookies, local_storage, session_storage
 
 # =====================
 # Capture sites
 # =====================
-def setup_driver():
+driver_path = None
+driver_path_lock = threading.Lock()
+
+def get_driver_path():
+    # Resolve chromedriver once per process instead of once per site; pool threads starting
+    # together wait for the first install rather than each downloading it
+    global driver_path
+    with driver_path_lock:
+        if driver_path is None:
+            driver_path = ChromeDriverManager().install()
+        return driver_path
+
+def setup_driver(headless=False):
     options = Options()
-    #options.add_argument("--headless=new")
-    options.add_argument("--start-maximized")
-    options.add_argument("--auto-open-devtools-for-tabs")
+    if headless:
+        options.add_argument("--headless=new")
+    else:
+        options.add_argument("--start-maximized")
+        options.add_argument("--auto-open-devtools-for-tabs")
     options.add_argument("--disable-gpu")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
     #options.add_argument("--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 13_0) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Safari/605.1.15")
     options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
 
-    service = Service(ChromeDriverManager().install())
+    service = Service(get_driver_path())
     return webdriver.Chrome(service=service, options=options)
 
-def capture_site_data(url, base_output_folder):
+def capture_site_data(url, base_output_folder, driver=None, quiet_window=2.0, max_wait=20, capture_format="binary",
+                      save_all_headers=True):
+    with metrics.site(get_hostname(url)), metrics.timer("capture_total"):
+        return capture_site(url, base_output_folder, driver, quiet_window, max_wait, capture_format, save_all_headers)
+
+def capture_site(url, base_output_folder, driver, quiet_window, max_wait, capture_format, save_all_headers):
     hostname = get_hostname(url)
     capture_folder = os.path.join(base_output_folder, hostname + "/capture")
-    driver = setup_driver()
+
+    # Drivers handed in by a pool are reused and must not be quit here
+    own_driver = driver is None
+    if own_driver:
+        with metrics.timer("driver_start"):
+            driver = setup_driver()
 
     try:
         # ======
         # Visit url
-        visit_url(driver, url)
+        collector = NetworkEventCollector()
+        timing = visit_url(driver, url, collector, quiet_window, max_wait)
 
         # ======
         # Get storage information
-        storage_values, cookies, local_storage, session_storage = get_storage_information(driver)
+        with metrics.timer("storage_extraction"):
+            storage_values, cookies, local_storage, session_storage = get_storage_information(driver)
+        metrics.count("storage_values", len(storage_values))
 
         # ======
         # Get network information
-        logs = driver.get_log("performance")
-        network_events = extract_network_events(logs)
-        all_headers = get_headers(network_events, hostname)
+        collector.drain(driver)
+        network_events = collector.events
+        metrics.count("events", len(network_events))
+
+        # Headers are written as they are flattened; without all_headers they are
+        # derived from the network events when processing
+        if save_all_headers:
+            with metrics.timer("header_extraction"):
+                with open_capture_list(os.path.join(capture_folder, "all_headers"), capture_format) as sink:
+                    for header in iter_headers(network_events, hostname):
+                        sink.write(header)
+            metrics.count("headers", sink.n_records)
 
         # =====
         # Save information
-        data_to_save = [
-            (network_events, "network_events.json"),
-            (all_headers, "all_headers.json"),
-            (cookies, "cookies.json"),
-            (local_storage, "local_storage.json"),
-            (session_storage, "session_storage.json"),
-            (storage_values, "storage_values.json")
-        ]
-        for data, filename in data_to_save:
-            save_json(data, os.path.join(capture_folder, filename))
-
-        print(f"[✓] Captured: {hostname}")
+        save_site_capture(capture_folder, url, timing, network_events, None, cookies,
+                          local_storage, session_storage, storage_values, capture_format)
+
+        print(f"[✓] Captured: {hostname} (settled in {timing['settle_seconds']}s)")
+        return True
 
     except Exception as e:
         print(f"[✗] Failed: {url} — {str(e)}")
-        return []
+        return False
+    finally:
+        if own_driver:
+            driver.quit()
+
+def save_site_capture(capture_folder, url, timing, network_events, all_headers, cookies,
+                      local_storage, session_storage, storage_values, capture_format="binary"):
+    data_to_save = [
+        (network_events, "network_events"),
+        (all_headers, "all_headers"),
+        (cookies, "cookies"),
+        (local_storage, "local_storage"),
+        (session_storage, "session_storage"),
+        (storage_values, "storage_values")
+    ]
+    for data, filename in data_to_save:
+        if data is None:
+            continue
+        with metrics.timer("capture_write"):
+            save_capture_file(data, os.path.join(capture_folder, filename), capture_format)
+        if metrics.enabled:
+            metrics.count("bytes_written", file_size(find_capture_file(os.path.join(capture_folder, filename))))
+
+    # Written last, marks the capture as complete
+    save_json(dict(url=url, **timing), os.path.join(capture_folder, "capture_info.json"))
+
+def capture_multiple_sites(urls, result_base_folder="results", workers=1, site_timeout=120,
+                           quiet_window=2.0, max_wait=20, capture_format="binary", save_all_headers=True):
+    # Sequential capture with a fresh browser per site
+    if workers <= 1:
+        for url in urls:
+            capture_site_data(url, result_base_folder, quiet_window=quiet_window, max_wait=max_wait,
+                              capture_format=capture_format, save_all_headers=save_all_headers)
+        return
+
+    # Concurrent capture with a bounded pool of reusable headless drivers
+    pool = DriverPool(lambda: setup_driver(headless=True), workers, site_timeout)
+    try:
+        results = pool.map(
+            lambda url, driver: capture_site_data(url, result_base_folder, driver, quiet_window, max_wait, capture_format,
+                                                  save_all_headers),
+            urls)
     finally:
-        driver.quit()
+        pool.close()
 
-def capture_multiple_sites(urls, result_base_folder="results"):
-    for url in urls:
-        capture_site_data(url, result_base_folder)
+    failed = [url for url in urls if not results.get(url)]
+    print(f"[✓] Captured {len(urls) - len(failed)}/{len(urls)} sites")
+    for url in failed:
+        print("    Failed:", url)
 
 # =====================
 # Process sites
 # =====================
-def process_site_data(url, base_output_folder):
+def process_site_data(url, base_output_folder, streaming=False, feature_cache=True, consolidate_stats=False,
+                      background_flush=False):
+    with metrics.site(get_hostname(url)), metrics.timer("process_total"):
+        return process_site(url, base_output_folder, streaming, feature_cache, consolidate_stats, background_flush)
+
+def process_site(url, base_output_folder, streaming, feature_cache, consolidate_stats, background_flush):
     hostname = get_hostname(url)
     print(f"[🌐] Webpage: {hostname}")
 
+    # Outputs are buffered and replace the site's pipeline/stats folders in one step
     capture_folder = os.path.join(base_output_folder, hostname + "/capture")
-    pipeline_folder = os.path.join(base_output_folder, hostname + "/pipeline")
-    stats_folder = os.path.join(base_output_folder, hostname + "/stats")
+    writer = ResultWriter(os.path.join(base_output_folder, hostname), consolidate_stats)
+    pipeline_folder = writer.folder("pipeline")
+    stats_folder = writer.folder("stats")
 
     # =====
     # Read files to process headers
-    all_headers = read_json(capture_folder+"/all_headers.json")
-    default_headers = load_standard_headers("standard_headers.txt")
-    storage_values = set(read_json(capture_folder+"/storage_values.json"))
+    with metrics.timer("capture_read"):
+        default_headers = load_header_catalog(*STANDARD_HEADER_FILES)
+
+    # Captures without all_headers can only be streamed from their network events
+    try:
+        find_capture_file(capture_folder+"/all_headers")
+    except FileNotFoundError:
+        streaming = True
+    if streaming:
+        with metrics.timer("capture_read"):
+            storage_values = StorageMatcher(read_capture_file(capture_folder+"/storage_values"))
+        return process_site_streaming(hostname, capture_folder, writer, default_headers, storage_values,
+                                      background_flush)
+
+    # Header tables are cached with their features per capture: on a hit, neither the
+    # headers nor the storage values are read. The features replace the storage values.
+    cache = FeatureCache(feature_cache_path(base_output_folder)) if feature_cache else None
+    header_table = load_header_table(capture_folder, hostname, default_headers, cache)
+    storage_values = None
+    metrics.count("headers", header_table.n_headers)
+    metrics.count("unique_headers", header_table.n_rows)
+    metrics.count("request_repeats", header_table.index.n_request_repeats)
 
     # =====
     # Get custom headers and save information
-    custom_headers, standard_headers = get_custom_headers(
-        all_headers, default_headers, storage_values, pipeline_folder
-    )
+    with metrics.timer("filtering"):
+        custom_headers, standard_headers = get_custom_headers(
+            header_table, default_headers, storage_values, pipeline_folder, HEURISTIC_ORDER
+        )
+    metrics.count("custom_headers", len(custom_headers))
 
     data_to_save = [
         (custom_headers, "custom_headers.json"),
         (standard_headers, "standard_headers.json"),
     ]
     for data, filename in data_to_save:
-        save_json(data, os.path.join(pipeline_folder, filename))
+        save_result(data, pipeline_folder, filename)
 
     # =====
     # Get filtering permutation statistics
-    get_filtering_permutation_stats(all_headers, default_headers, storage_values, stats_folder)
+    with metrics.timer("stats"):
+        get_filtering_permutation_stats(header_table, default_headers, storage_values, stats_folder)
 
+    writer.flush(background_flush)
 
-    return custom_headers, len(all_headers)
+    return custom_headers, header_table.n_headers
+
+def process_site_streaming(hostname, capture_folder, writer, default_headers, storage_values, background_flush):
+    # One pass, headers are never all in memory: streamed from all_headers, or flattened
+    # from the streamed network events
+    try:
+        headers = iter_capture_file(capture_folder+"/all_headers")
+    except FileNotFoundError:
+        headers = iter_headers(iter_capture_file(capture_folder+"/network_events"), hostname)
+
+    with metrics.timer("filtering"):
+        custom_headers, standard_headers, num_headers = stream_custom_headers(
+            headers, default_headers, storage_values, writer.folder("pipeline"), writer.folder("stats"),
+            order=HEURISTIC_ORDER
+        )
+    metrics.count("headers", num_headers)
+    metrics.count("custom_headers", len(custom_headers))
 
+    data_to_save = [
+        (custom_headers, "custom_headers.json"),
+        (standard_headers, "standard_headers.json"),
+    ]
+    for data, filename in data_to_save:
+        save_result(data, writer.folder("pipeline"), filename)
+    writer.flush(background_flush)
+
+    return custom_headers, num_headers
+
+
+def process_multiple_sites(urls, result_base_folder="results", incremental=True, workers=1, streaming=False,
+                           feature_cache=True, consolidate_stats=False, background_flush=True):
+    # Sites whose capture, standard headers and filter code are unchanged are skipped
+    manifest = Manifest(result_base_folder)
+    header_index = HeaderIndex(index_path(result_base_folder))
+    filter_config_hash = hash_filter_config()
+    hostnames = [get_hostname(url) for url in urls]
+    site_results = [None] * len(urls)
+    pending = []
+
+    for index, (url, hostname) in enumerate(zip(urls, hostnames)):
+        capture_folder = os.path.join(result_base_folder, hostname + "/capture")
+        inputs_hash = hash_site_inputs(capture_folder, STANDARD_HEADER_FILES, filter_config_hash)
+
+        if incremental and manifest.is_current(hostname, inputs_hash):
+            print(f"[=] Unchanged: {hostname}")
+            custom_headers = read_json(os.path.join(result_base_folder, hostname + "/pipeline/custom_headers.json"))
+            site_results[index] = (custom_headers, manifest.num_headers(hostname))
+            # Sites processed before the index existed are indexed from their results
+            if not header_index.is_current(hostname, inputs_hash):
+                header_index.update_site(hostname, custom_headers, inputs_hash, manifest.num_headers(hostname))
+        else:
+            pending.append((index, url, inputs_hash))
+
+    # Process the remaining sites, serially or on a process pool
+    try:
+        for position, result in run_site_processing(pending, result_base_folder, workers, streaming, feature_cache,
+                                                        consolidate_stats, background_flush):
+            index, _, inputs_hash = pending[position]
+            site_results[index] = result
+            manifest.record(hostnames[index], inputs_hash, result[1])
+            header_index.update_site(hostnames[index], result[0], inputs_hash, result[1])
+    finally:
+        # A run stopped by an exception still completes the background flushes it started
+        wait_for_flushes()
+        header_index.close()
 
-def process_multiple_sites(urls, result_base_folder="results"):
-    all_custom_headers = []
-    num_total_headers = 0
-    for url in urls:
-        custom_headers_curr_url, all_headers_curr_url = process_site_data(url, result_base_folder)
-        all_custom_headers.append(custom_headers_curr_url)
-        num_total_headers = num_total_headers + all_headers_curr_url
-    save_json(all_custom_headers, os.path.join(result_base_folder, "all_custom_headers.json"))
+    # Aggregate in the order of urls, whatever the completion order was
+    all_custom_headers = [custom_headers for custom_headers, _ in site_results]
+    num_total_headers = sum(num_headers for _, num_headers in site_results)
+    if pending or not manifest.aggregate_is_current(hostnames):
+        save_json(all_custom_headers, os.path.join(result_base_folder, "all_custom_headers.json"))
+        manifest.record_aggregate(hostnames)
 
     num_custom_headers = sum(len(headers) for headers in all_custom_headers if headers)
 
     # Print information
     print("\n==========")
     print("total websites: ",len(urls))
+    print("reprocessed websites: ", len(pending))
     print("total headers: ", num_total_headers)
     print("total custom headers: ", num_custom_headers)
 
+def run_site_processing(pending, result_base_folder, workers, streaming=False, feature_cache=True,
+                        consolidate_stats=False, background_flush=True):
+    # Yields (position in pending, (custom headers, number of headers)) as sites complete
+    if workers <= 1:
+        # With background flushes, a site's files are written while the next site is
+        # processed; a site is only yielded (and recorded) once its files are in place
+        previous = None
+        for position, (_, url, _) in enumerate(pending):
+            result = process_site_data(url, result_base_folder, streaming, feature_cache, consolidate_stats,
+                                       background_flush)
+            if previous is not None:
+                yield finish_site_flush(previous, pending, result_base_folder)
+            previous = (position, result)
+        if previous is not None:
+            yield finish_site_flush(previous, pending, result_base_folder)
+        return
+
+    # Workers record their own metrics, which are sent back with each result.
+    # Each worker already writes in parallel with the others, its flushes are synchronous.
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        site_args = (result_base_folder, streaming, feature_cache, consolidate_stats, False)
+        futures = {
+            executor.submit(run_with_metrics, process_site_data, get_hostname(url), url, *site_args)
+            if metrics.enabled else executor.submit(process_site_data, url, *site_args): position
+            for position, (_, url, _) in enumerate(pending)
+        }
+        for n_done, future in enumerate(as_completed(futures), 1):
+            position = futures[future]
+            if metrics.enabled:
+                (custom_headers, num_headers), site_metrics = future.result()
+                metrics.merge(get_hostname(pending[position][1]), site_metrics)
+            else:
+                custom_headers, num_headers = future.result()
+            print(f"[✓] Processed: {get_hostname(pending[position][1])} ({n_done}/{len(pending)})")
+            yield position, (custom_headers, num_headers)
+
+def finish_site_flush(site_result, pending, result_base_folder):
+    position, result = site_result
+    wait_for_flush(os.path.join(result_base_folder, get_hostname(pending[position][1])))
+    return position, result
+
 # =====================
 # Main
 # =====================
@@ -188,6 +428,20 @@ if __name__ == "__main__":
     # Please change flags as needed
     capture = False  # Can be false if network information already available in folder "results/website/capture"
     process = True
+    incremental = True  # Skip sites whose capture and filters have not changed since the last run
+    workers = 1  # Number of processes used to process sites (1 = sequential)
+    capture_workers = 1  # Number of concurrent headless browsers (1 = sequential)
+    site_timeout = 120  # Seconds before a hung site is abandoned (concurrent capture only)
+    quiet_window = 2.0  # Seconds without new requests before a page counts as settled
+    max_wait = 20  # Hard ceiling in seconds for page settling
+    capture_format = "binary"  # "binary" (compact, see capture_format.py) or "json" (indented)
+    save_all_headers = True  # False: all_headers is not saved, processing derives it from network_events
+    streaming = False  # Process each site in one streaming pass instead of the columnar path
+    feature_cache = True  # Reuse header tables and their features across runs, see feature_cache.py
+    consolidate_stats = False  # One stats/filtering_combinations.json per site instead of 15 files
+    background_flush = True  # Write a site's results while the next one is processed (sequential only)
+    capture_backend = "selenium"  # "selenium" (performance log) or "cdp" (DevTools websocket, see cdp_capture.py)
+    collect_metrics = False  # Per-stage timings and counters, saved to results/metrics/
 
     # ======
     # Define websites
@@ -280,9 +534,48 @@ if __name__ == "__main__":
         "http://www.google.co.uk/", #✅
     ]
 
+    # ======
+    # Command line overrides
+    arg_parser = argparse.ArgumentParser(description="Capture websites and extract their custom headers.")
+    arg_parser.add_argument("--capture", action=argparse.BooleanOptionalAction, default=capture)
+    arg_parser.add_argument("--process", action=argparse.BooleanOptionalAction, default=process)
+    arg_parser.add_argument("--incremental", action=argparse.BooleanOptionalAction, default=incremental)
+    arg_parser.add_argument("--workers", type=int, default=workers, help="processes used to process sites")
+    arg_parser.add_argument("--capture-workers", type=int, default=capture_workers, help="concurrent browsers used to capture sites")
+    arg_parser.add_argument("--capture-format", choices=["binary", "json"], default=capture_format)
+    arg_parser.add_argument("--save-all-headers", action=argparse.BooleanOptionalAction, default=save_all_headers)
+    arg_parser.add_argument("--streaming", action=argparse.BooleanOptionalAction, default=streaming)
+    arg_parser.add_argument("--feature-cache", action=argparse.BooleanOptionalAction, default=feature_cache)
+    arg_parser.add_argument("--consolidate-stats", action=argparse.BooleanOptionalAction, default=consolidate_stats)
+    arg_parser.add_argument("--background-flush", action=argparse.BooleanOptionalAction, default=background_flush)
+    arg_parser.add_argument("--capture-backend", choices=["selenium", "cdp"], default=capture_backend)
+    arg_parser.add_argument("--metrics", action=argparse.BooleanOptionalAction, default=collect_metrics)
+    args = arg_parser.parse_args()
+
+    if args.metrics:
+        metrics.enable()
+
     # ======
     # Capture website, process information, or both
-    if capture:
-        capture_multiple_sites(websites)
-    if process:
-        process_multiple_sites(websites)
\ No newline at end of file
+    if args.capture and args.capture_backend == "cdp":
+        # Imported here so the Selenium backend does not need websockets
+        import asyncio
+        from cdp_capture import capture_multiple_sites_cdp
+        asyncio.run(capture_multiple_sites_cdp(websites, tabs=args.capture_workers, site_timeout=site_timeout,
+                                               quiet_window=quiet_window, max_wait=max_wait,
+                                               capture_format=args.capture_format,
+                                               save_all_headers=args.save_all_headers))
+    elif args.capture:
+        capture_multiple_sites(websites, workers=args.capture_workers, site_timeout=site_timeout,
+                               quiet_window=quiet_window, max_wait=max_wait, capture_format=args.capture_format,
+                               save_all_headers=args.save_all_headers)
+    if args.process:
+        process_multiple_sites(websites, incremental=args.incremental, workers=args.workers, streaming=args.streaming,
+                               feature_cache=args.feature_cache, consolidate_stats=args.consolidate_stats,
+                               background_flush=args.background_flush)
+
+    if args.metrics:
+        metrics_path = metrics_file("results")
+        metrics.save(metrics_path)
+        metrics.print_summary()
+        print(f"[✓] Metrics saved to {metrics_path}")
@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+
+from information_api import read_json, save_json, find_capture_file
+from result_writer import CONSOLIDATED_STATS_FILE
+
+# Files a site's processing depends on (the first of each group that exists: headers can be
+# derived from the network events), and the code that defines the filters (and resolves the
+# domains of headers derived from network events)
+CAPTURE_INPUTS = [("all_headers", "network_events"), ("storage_values",)]
+FILTER_MODULES = [
+    "domain_resolver.py",
+    "header_analysis.py",
+    "header_catalog.py",
+    "header_dedup.py",
+    "header_table.py",
+    "heuristics.py",
+    "pipeline_filtering.py",
+    "permutation_filtering_stats.py",
+    "storage_matcher.py"
+]
+
+# Files a processed site must have to be skipped: the pipeline outputs, and the stats
+# files or their consolidated version
+PIPELINE_OUTPUTS = [
+    "pipeline/custom_headers.json",
+    "pipeline/standard_headers.json",
+    "pipeline/compound_filter_stats.json"
+]
+STATS_OUTPUTS = ["stats/filtering_combination" + str(n) + ".json" for n in range(1, 16)]
+CONSOLIDATED_STATS_OUTPUTS = ["stats/" + CONSOLIDATED_STATS_FILE]
+
+#####################################
+# Manifest of processed sites
+#####################################
+class Manifest:
+    def __init__(self, result_base_folder):
+        self.path = os.path.join(result_base_folder, "manifest.json")
+        self.result_base_folder = result_base_folder
+        data = read_json(self.path) if os.path.exists(self.path) else {}
+        self.sites = data.get("sites", {})
+        # Sites, in order, that all_custom_headers.json was last built from
+        self.aggregate = data.get("all_custom_headers", [])
+
+    def is_current(self, hostname, inputs_hash):
+        entry = self.sites.get(hostname)
+        if entry is None or entry["inputs_hash"] != inputs_hash:
+            return False
+        site_folder = os.path.join(self.result_base_folder, hostname)
+        has_outputs = lambda outputs: all(os.path.exists(os.path.join(site_folder, output)) for output in outputs)
+        return has_outputs(PIPELINE_OUTPUTS) and (has_outputs(STATS_OUTPUTS) or has_outputs(CONSOLIDATED_STATS_OUTPUTS))
+
+    def num_headers(self, hostname):
+        return self.sites[hostname]["num_headers"]
+
+    def record(self, hostname, inputs_hash, num_headers):
+        self.sites[hostname] = {
+            "inputs_hash": inputs_hash,
+            "num_headers": num_headers
+        }
+        self.save()
+
+    def aggregate_is_current(self, hostnames):
+        aggregate_file = os.path.join(self.result_base_folder, "all_custom_headers.json")
+        return self.aggregate == hostnames and os.path.exists(aggregate_file)
+
+    def record_aggregate(self, hostnames):
+        self.aggregate = hostnames
+        self.save()
+
+    def save(self):
+        save_json({"sites": self.sites, "all_custom_headers": self.aggregate}, self.path)
+
+#####################################
+# Hashing
+#####################################
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_filter_config():
+    return hash_modules(FILTER_MODULES)
+
+def hash_modules(modules):
+    digest = hashlib.sha256()
+    module_folder = os.path.dirname(os.path.abspath(__file__))
+    for module in modules:
+        digest.update(module.encode())
+        digest.update(hash_file(os.path.join(module_folder, module)).encode())
+    return digest.hexdigest()
+
+def find_capture_inputs(capture_folder):
+    paths = []
+    for alternatives in CAPTURE_INPUTS:
+        for name in alternatives:
+            try:
+                paths.append(find_capture_file(os.path.join(capture_folder, name)))
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            raise FileNotFoundError(f"No {alternatives[0]} capture in {capture_folder}")
+    return paths
+
+def hash_capture_inputs(capture_folder, standard_header_files):
+    # Hash of each input file, by name
+    inputs = {os.path.splitext(os.path.basename(path))[0]: hash_file(path)
+              for path in find_capture_inputs(capture_folder)}
+    inputs["standard_headers"] = [hash_file(path) for path in standard_header_files]
+    return inputs
+
+def hash_site_inputs(capture_folder, standard_header_files, filter_config_hash):
+    inputs = hash_capture_inputs(capture_folder, standard_header_files)
+    inputs["filter_config"] = filter_config_hash
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
@@ -0,0 +1,156 @@
+import os
+import time
+import threading
+from contextlib import nullcontext
+
+from information_api import save_json
+
+# Records outside of any site (e.g. driver start-up) go here
+RUN_SCOPE = "_run"
+
+NULL_CONTEXT = nullcontext()
+
+#####################################
+# Metrics registry
+#####################################
+class Metrics:
+    # Wall time per stage and counters, grouped by site. Disabled by default: timer()
+    # then returns a shared no-op context and count() returns immediately.
+    def __init__(self):
+        self.enabled = False
+        self.sites = {}
+        self.lock = threading.Lock()
+        # Current site of each thread (the capture pool runs one site per thread)
+        self.local = threading.local()
+        self.started = None
+
+    def enable(self):
+        self.enabled = True
+        self.started = time.time()
+
+    def site(self, hostname):
+        if not self.enabled:
+            return NULL_CONTEXT
+        return SiteScope(self, hostname)
+
+    def timer(self, stage):
+        if not self.enabled:
+            return NULL_CONTEXT
+        return StageTimer(self, stage)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        counters = self.get_site()["counters"]
+        counters[name] = counters.get(name, 0) + n
+
+    # ======
+    # Storage
+    def get_site(self, hostname=None):
+        hostname = hostname or getattr(self.local, "site", None) or RUN_SCOPE
+        entry = self.sites.get(hostname)
+        if entry is None:
+            with self.lock:
+                entry = self.sites.setdefault(hostname, {"timings": {}, "counters": {}})
+        return entry
+
+    def add_time(self, stage, seconds, hostname=None):
+        # hostname is given by callers that interleave sites on one thread (asyncio)
+        timings = self.get_site(hostname)["timings"]
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def take(self, hostname):
+        # Removes and returns the metrics of a site
+        with self.lock:
+            return self.sites.pop(hostname, {"timings": {}, "counters": {}})
+
+    def merge(self, hostname, site_metrics):
+        # Metrics recorded by another process for one site
+        if not self.enabled:
+            return
+        entry = self.get_site(hostname)
+        for kind in ("timings", "counters"):
+            for name, value in site_metrics[kind].items():
+                entry[kind][name] = entry[kind].get(name, 0) + value
+
+    # ======
+    # Reporting
+    def totals(self):
+        # Per stage and counter: total, number of sites, mean and max over sites
+        totals = {"timings": {}, "counters": {}}
+        for entry in self.sites.values():
+            for kind in ("timings", "counters"):
+                for name, value in entry[kind].items():
+                    total = totals[kind].setdefault(name, {"total": 0, "sites": 0, "max": 0})
+                    total["total"] += value
+                    total["sites"] += 1
+                    total["max"] = max(total["max"], value)
+        for kind in totals.values():
+            for total in kind.values():
+                total["mean"] = total["total"] / total["sites"]
+        return totals
+
+    def save(self, path):
+        save_json({
+            "started": self.started,
+            "finished": time.time(),
+            "sites": self.sites,
+            "totals": self.totals()
+        }, path)
+
+    def print_summary(self):
+        totals = self.totals()
+        print("\n==========")
+        print(f"{'stage':<22} {'total s':>10} {'sites':>6} {'mean s':>9} {'max s':>9}")
+        for stage, total in sorted(totals["timings"].items(), key=lambda item: -item[1]["total"]):
+            print(f"{stage:<22} {total['total']:>10.2f} {total['sites']:>6} {total['mean']:>9.3f} {total['max']:>9.3f}")
+        print(f"\n{'counter':<22} {'total':>12} {'sites':>6} {'mean':>12} {'max':>12}")
+        for name, total in sorted(totals["counters"].items()):
+            print(f"{name:<22} {total['total']:>12,} {total['sites']:>6} {total['mean']:>12,.0f} {total['max']:>12,}")
+
+class SiteScope:
+    def __init__(self, metrics, hostname):
+        self.metrics = metrics
+        self.hostname = hostname
+
+    def __enter__(self):
+        self.previous = getattr(self.metrics.local, "site", None)
+        self.metrics.local.site = self.hostname
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.local.site = self.previous
+
+class StageTimer:
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_time(self.stage, time.perf_counter() - self.start)
+
+# Process-wide registry
+metrics = Metrics()
+
+#####################################
+# Helper functions
+#####################################
+def run_with_metrics(function, hostname, *args):
+    # Runs function in a worker process and returns (result, metrics of the site)
+    metrics.enable()
+    with metrics.site(hostname):
+        result = function(*args)
+    return result, metrics.take(hostname)
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def metrics_file(result_base_folder):
+    return os.path.join(result_base_folder, "metrics", time.strftime("run-%Y%m%d-%H%M%S.json"))
@@ -0,0 +1,51 @@
+import json
+
+from metrics import metrics
+
+# Only these DevTools messages are kept, everything else is dropped unparsed
+KEPT_METHODS = ("Network.requestWillBeSent", "Network.responseReceived")
+
+#####################################
+# Incremental performance-log collector
+#####################################
+class NetworkEventCollector:
+    def __init__(self, methods=KEPT_METHODS):
+        self.methods = set(methods)
+        # The quoted method name must appear verbatim in the raw message to be worth parsing
+        self.markers = tuple('"' + method + '"' for method in methods)
+
+        self.events = []
+        self.n_entries = 0
+        self.n_requests = 0
+
+    def drain(self, driver):
+        # Reading the log empties Chrome's buffer, so drain it while the page loads
+        with metrics.timer("log_drain"):
+            return self.ingest(driver.get_log("performance"))
+
+    def ingest(self, entries):
+        new_requests = 0
+        for entry in entries:
+            self.n_entries += 1
+            raw_message = entry["message"]
+
+            # Cheap pre-filter before the full JSON parse
+            if not any(marker in raw_message for marker in self.markers):
+                continue
+
+            try:
+                message = json.loads(raw_message)["message"]
+            except (json.JSONDecodeError, KeyError):
+                continue
+
+            method = message.get("method")
+            if method not in self.methods:
+                continue
+
+            self.events.append(message)
+            if method == "Network.requestWillBeSent":
+                new_requests += 1
+
+        self.n_requests += new_requests
+        metrics.count("log_entries", len(entries))
+        return new_requests
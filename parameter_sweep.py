@@ -0,0 +1,120 @@
+import os
+import csv
+import time
+import argparse
+import itertools
+
+from header_catalog import load_header_catalog, STANDARD_HEADER_FILES
+from heuristics import build_context, get_heuristics
+from feature_cache import FeatureCache, feature_cache_path, load_header_table
+
+SWEEP_FILE = "parameter_sweep.csv"
+THRESHOLDS = list(range(0, 33))
+
+# Rules of the stateful consistency heuristic
+CONSISTENCY_RULES = {
+    # Pipeline rule: the first value seen for a name wins, later different values are dropped
+    "first": lambda table, reach: table.consistent_mask(reach),
+    # Names seen with more than one value are dropped entirely
+    "single": lambda table, reach: table.single_value_mask(reach)
+}
+
+COLUMNS = ["hostname", "filters", "min_length", "consistency", "headers", "custom_headers", "surviving_headers"]
+
+#####################################
+# Grid
+#####################################
+def build_grid(thresholds=THRESHOLDS, rules=tuple(CONSISTENCY_RULES), filter_names=None):
+    # Every subset of the filters (canonical order), with each threshold when min_length is
+    # part of it and each consistency rule when a stateful filter is
+    filters = [f for f in get_heuristics(include_preprocessing=False) if filter_names is None or f.name in filter_names]
+    grid = []
+    for r in range(1, len(filters)+1):
+        for combo in itertools.combinations(filters, r):
+            names = [f.name for f in combo]
+            for threshold in (thresholds if "min_length" in names else [None]):
+                for rule in (rules if any(f.stateful for f in combo) else [None]):
+                    grid.append((combo, threshold, rule))
+    return grid
+
+#####################################
+# Sweep
+#####################################
+def sweep_site(hostname, header_table, default_headers, grid):
+    # The standard header check always comes first, as in the pipeline. Stateless masks are
+    # computed once per threshold, stateful ones once per rule and set of reaching rows.
+    custom = header_table.custom_mask(default_headers)
+    n_custom = header_table.count(custom)
+    keep_masks = {}
+    rows = []
+    for combo, threshold, rule in grid:
+        # Features are already computed, storage values are no longer needed
+        context = build_context(default_headers, None, threshold)
+        reach = custom
+        for f in combo:
+            key = (f.name, rule, reach) if f.stateful else (f.name, threshold)
+            if key not in keep_masks:
+                if f.stateful:
+                    keep_masks[key] = CONSISTENCY_RULES[rule](header_table, reach)
+                else:
+                    keep_masks[key] = f.column(header_table, context, header_table.all_rows)
+            reach &= keep_masks[key]
+
+        rows.append({
+            "hostname": hostname,
+            "filters": "+".join(f.name for f in combo),
+            "min_length": "" if threshold is None else threshold,
+            "consistency": rule or "",
+            "headers": header_table.n_headers,
+            "custom_headers": n_custom,
+            "surviving_headers": header_table.count(reach)
+        })
+    return rows
+
+def run_sweep(result_base_folder, hostnames, grid, output_file, use_cache=True):
+    default_headers = load_header_catalog(*STANDARD_HEADER_FILES)
+    cache = FeatureCache(feature_cache_path(result_base_folder)) if use_cache else None
+
+    with open(output_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        for hostname in hostnames:
+            capture_folder = os.path.join(result_base_folder, hostname, "capture")
+            header_table = load_header_table(capture_folder, hostname, default_headers, cache)
+            writer.writerows(sweep_site(hostname, header_table, default_headers, grid))
+
+#####################################
+# Helper functions
+#####################################
+def find_sites(result_base_folder):
+    # Sites of the results folder that have a capture
+    return [
+        hostname for hostname in sorted(os.listdir(result_base_folder))
+        if os.path.isdir(os.path.join(result_base_folder, hostname, "capture"))
+    ]
+
+#####################################
+# Command line
+#####################################
+if __name__ == "__main__":
+    filter_names = [f.name for f in get_heuristics(include_preprocessing=False)]
+
+    arg_parser = argparse.ArgumentParser(description="Evaluate the pipeline over a grid of thresholds and filters.")
+    arg_parser.add_argument("--results", default="results", help="results folder holding the captures")
+    arg_parser.add_argument("--sites", nargs="+", help="hostnames (default: every captured site)")
+    arg_parser.add_argument("--thresholds", nargs="+", type=int, default=THRESHOLDS, help="minimum value lengths")
+    arg_parser.add_argument("--rules", nargs="+", choices=list(CONSISTENCY_RULES), default=list(CONSISTENCY_RULES))
+    arg_parser.add_argument("--filters", nargs="+", choices=filter_names, default=filter_names,
+                            help="filters whose subsets are evaluated")
+    arg_parser.add_argument("--output", help=f"CSV file (default: <results>/{SWEEP_FILE})")
+    arg_parser.add_argument("--feature-cache", action=argparse.BooleanOptionalAction, default=True)
+    args = arg_parser.parse_args()
+
+    hostnames = args.sites or find_sites(args.results)
+    grid = build_grid(args.thresholds, args.rules, args.filters)
+    output_file = args.output or os.path.join(args.results, SWEEP_FILE)
+
+    start = time.perf_counter()
+    run_sweep(args.results, hostnames, grid, output_file, args.feature_cache)
+    print(f"[✓] {len(grid)} configurations x {len(hostnames)} sites in {time.perf_counter() - start:.2f}s")
+    print(f"[✓] Saved to {output_file}")
@@ -2,151 +2,173 @@ import urllib.parse
 import re
 import json
 
-
+# Budget for parse_nested_json: containers nested deeper are kept as they are,
+# longer strings are not parsed
+MAX_JSON_DEPTH = 64
+MAX_JSON_STRING_LENGTH = 10_000_000
+
+JSON_WHITESPACE = " \t\n\r"
+JSON_NUMBER_START = set("-0123456789")
+JSON_LITERALS = {"true", "false", "null", "NaN", "Infinity"}
+NOT_JSON = object()
+
+# Separators of multi-field values, e.g. "a=1|b=2" or "GS1.1.s123$o1$g0"
+FIELD_SEPARATORS = re.compile(r"[|:$&]")
+
+#####################################
+# Value extraction
+#####################################
 def extract_all_cookie_values(cookies):
-    # ======
-    # Initialize set
-    values = set()
+    return set(iter_cookie_values(cookies))
 
-    # ======
-    # Loop
-    for cookie in cookies:
-        raw_value = cookie.get("value", "")
-        if not raw_value:
-            continue
-
-        # Case 1: URL-encoded → decode and split
-        if "%" in raw_value:
-            decoded = urllib.parse.unquote(raw_value)
-            parts = re.split(r"[|:$&]", decoded)
-            for part in parts:
-                part = part.strip()
-                if not part:
-                    continue
-                if "=" in part:
-                    _, val = part.split("=", 1)
-                    val = val.strip()
-                    if val:
-                        values.add(val)  # ✅ fixed
-                else:
-                    values.add(part)
-
-        # Case 2: Not encoded but contains key=value → extract value from each pair
-        elif "=" in raw_value:
-            segments = re.split(r"[:|$&]", raw_value)  # Handle multi-field formats
-            for seg in segments:
-                if "=" in seg:
-                    _, val = seg.split("=", 1)
-                    val = val.strip()
-                    if val:
-                        values.add(val)
-                else:
-                    values.add(seg.strip())
-
-        # Case 3: Plain unencoded value, no special structure
-        else:
-            values.add(raw_value.strip())
+def extract_all_storage_values(data):
+    return set(iter_storage_values(data))
 
+def extract_capture_values(cookies, *storages):
+    # Batch mode: every candidate value of a capture in one streaming pass
+    values = set(iter_cookie_values(cookies))
+    for storage in storages:
+        values.update(iter_storage_values(storage))
     return values
 
-def extract_all_storage_values(data):
-    # ======
-    # Initialize set
-    values = set()
+def iter_cookie_values(cookies):
+    for cookie in cookies:
+        raw_value = cookie.get("value", "")
+        if raw_value:
+            yield from iter_value_tokens(raw_value)
+
+def iter_storage_values(data):
+    # Iterative walk over nested dicts/lists
+    stack = [data]
+    while stack:
+        value = stack.pop()
 
-    # ======
-    # Recursion function
-    def recurse(value):
         # If dictionary
         if isinstance(value, dict):
-            for v in value.values():
-                recurse(v)
+            stack.extend(reversed(list(value.values())))
 
         # If list
         elif isinstance(value, list):
-            for elem in value:
-                recurse(elem)
+            stack.extend(reversed(value))
 
         # Else
-        else:
-            if not isinstance(value, str):
-                values.add(value)
-                return
+        elif not isinstance(value, str):
+            yield value
 
+        else:
             # Remove surrounding quotes
             if (value.startswith('"') and value.endswith('"')) or \
                (value.startswith("'") and value.endswith("'")):
                 value = value[1:-1]
-
-            # Case 1: URL-encoded → decode and split
-            if "%" in value:
-                decoded = urllib.parse.unquote(value)
-                parts = re.split(r"[|:$&]", decoded)
-                for part in parts:
-                    part = part.strip()
-                    if not part:
-                        continue
-                    if "=" in part:
-                        _, val = part.split("=", 1)
-                        val = val.strip()
-                        if val:
-                            values.add(val)
-                    else:
-                        values.add(part)
-
-            # Case 2: Not encoded but contains key=value → extract value from each pair
-            elif "=" in value:
-                segments = re.split(r"[:|$&]", value)  # Handle multi-field formats
-                for seg in segments:
-                    if "=" in seg:
-                        _, val = seg.split("=", 1)
-                        val = val.strip()
-                        if val:
-                            values.add(val)
-                    else:
-                        values.add(seg.strip())
-
-            # Case 3: Plain unencoded value, no special structure
+            yield from iter_value_tokens(value)
+
+def iter_value_tokens(value):
+    # Case 1: URL-encoded → decode and split
+    if "%" in value:
+        decoded = urllib.parse.unquote(value)
+        for part in FIELD_SEPARATORS.split(decoded):
+            part = part.strip()
+            if not part:
+                continue
+            if "=" in part:
+                val = part.split("=", 1)[1].strip()
+                if val:
+                    yield val
+            else:
+                yield part
+
+    # Case 2: Not encoded but contains key=value → extract value from each pair
+    elif "=" in value:
+        for seg in FIELD_SEPARATORS.split(value):
+            if "=" in seg:
+                val = seg.split("=", 1)[1].strip()
+                if val:
+                    yield val
             else:
-                values.add(value.strip())
+                yield seg.strip()
 
-    # ======
-    # Recursion callback
-    recurse(data)
-    return values
+    # Case 3: Plain unencoded value, no special structure
+    else:
+        yield value.strip()
+
+#####################################
+# Nested JSON
+#####################################
+def parse_nested_json(value, max_depth=MAX_JSON_DEPTH, max_string_length=MAX_JSON_STRING_LENGTH, cache=None):
+    # Iterative walk: a stack of (target container, key, value, depth) replaces recursion,
+    # so deeply nested storage cannot hit the recursion limit
+    if cache is None:
+        cache = {}
+    root = [None]
+    stack = [(root, 0, value, 0)]
+
+    while stack:
+        target, key, value, depth = stack.pop()
+
+        # =====
+        # If it's a string, try parsing as JSON (possibly several times when double-encoded)
+        while isinstance(value, str):
+            parsed = decode_json_string(value, cache, max_string_length)
+            if parsed is NOT_JSON:
+                break
+            value = parsed
+
+        # =====
+        # If it's a dict, parse each value
+        if isinstance(value, dict) and depth < max_depth:
+            new_dict = {}
+            for k, v in value.items():
+                # Fix mprtcl-v4
+                if "mprtcl-v4" in k and isinstance(v, str):
+                    v = fix_and_parse_mprtcl(v)
+                new_dict[k] = None
+                stack.append((new_dict, k, v, depth + 1))
+            target[key] = new_dict
+
+        # =====
+        # If it's a list
+        elif isinstance(value, list) and depth < max_depth:
+            new_list = [None] * len(value)
+            for i, elem in enumerate(value):
+                stack.append((new_list, i, elem, depth + 1))
+            target[key] = new_list
+
+        # =====
+        else:
+            target[key] = value
 
-def parse_nested_json(value):
-    #=====
-    # If it's a dict, parse each value recursively
-    if isinstance(value, dict):
-        new_dict = {}
-        for k, v in value.items():
-            # Fix mprtcl-v4
-            if "mprtcl-v4" in k and isinstance(v, str):
-                fixed = fix_and_parse_mprtcl(v)
-                new_dict[k] = parse_nested_json(fixed)
-            else:
-                new_dict[k] = parse_nested_json(v)
-        return new_dict
+    return root[0]
 
-    # =====
-    # If it's a list
-    elif isinstance(value, list):
-        return [parse_nested_json(elem) for elem in value]
+def decode_json_string(value, cache, max_string_length):
+    # Identical blobs stored under several keys are parsed once
+    if value in cache:
+        return cache[value]
 
-    # =====
-    # If it's a string, try parsing as JSON
-    elif isinstance(value, str):
+    parsed = NOT_JSON
+    if len(value) <= max_string_length and could_be_json(value):
         try:
             parsed = json.loads(value)
-            return parse_nested_json(parsed)
-
         except (json.JSONDecodeError, TypeError):
-            return value
-
-    # =====
-    else:
-        return value
+            pass
+
+    cache[value] = parsed
+    return parsed
+
+def could_be_json(value):
+    # Cheap rejection of ordinary strings before attempting json.loads
+    stripped = value.strip(JSON_WHITESPACE)
+    if not stripped:
+        return False
+    first = stripped[0]
+    if first == "{":
+        return stripped[-1] == "}"
+    if first == "[":
+        return stripped[-1] == "]"
+    if first == '"':
+        return len(stripped) > 1 and stripped[-1] == '"'
+    if first in JSON_NUMBER_START:
+        return True
+    return stripped in JSON_LITERALS
 
 def fix_and_parse_mprtcl(value):
     value = value.replace("'", '"')
@@ -1,79 +1,152 @@
 import itertools
-import urllib.parse
-import os
-from information_api import save_json
+from collections import Counter
+from result_writer import save_result
+from heuristics import get_heuristics, build_context
 
 #####################################
 # Permutations
 #####################################
 def permutation_statistics(all_headers, known_standard_headers, storage_values, output_folder):
-    filters = [third_party, min_length, consistent, not_in_storage]
-    n=1
+    counter = PermutationCounter(known_standard_headers, storage_values)
+    for header in all_headers:
+        counter.add(header)
+    counter.finish(output_folder)
+
+class PermutationCounter:
+    # Incremental permutation statistics: each header is reduced to its filter signature
+    # as it arrives, the combinations are only counted at the end
+    def __init__(self, known_standard_headers, storage_values):
+        self.filters = get_heuristics(include_preprocessing=False)
+        self.context = build_context(known_standard_headers, storage_values)
+        self.slots = build_filter_slots(self.filters)
+        self.required_bits = build_required_bits(self.slots)
+        self.states = {key: {} for key in self.slots}
+        self.signatures = Counter()
+        self.n_headers = 0
+
+    def add(self, header):
+        self.n_headers += 1
+        self.signatures[header_signature(header, self.filters, self.slots, self.required_bits,
+                                         self.states, self.context)] += 1
+
+    def finish(self, output_folder):
+        filters = self.filters
+        n=1
+        for r in range(1, len(filters)+1):
+            for combo in itertools.combinations(range(len(filters)), r):
+                filtering_stats = count_combination_removals(self.signatures, filters, self.slots, combo)
+
+                output_file = "filtering_combination" + str(n) + ".json"
+                combo_label = f"Combination {n}: " + " + ".join(filters[i].name for i in combo)
+
+                build_combination_report(
+                    filtering_stats, self.n_headers, output_folder, output_file, combo_label
+                )
+                n += 1
+
+#####################################
+# Columnar permutations
+#####################################
+def columnar_permutation_statistics(header_table, known_standard_headers, storage_values, output_folder):
+    filters = get_heuristics(include_preprocessing=False)
+    context = build_context(known_standard_headers, storage_values)
+
+    # Keep masks of the stateless filters, computed once on the whole columns.
+    # A stateful filter depends on the rows reaching it, i.e. on the filters before it.
+    keep_masks = {
+        (f.name, None): f.column(header_table, context, header_table.all_rows)
+        for f in filters if not f.stateful
+    }
 
+    n=1
     for r in range(1, len(filters)+1):
-        for combo in itertools.combinations(filters,r):
-            filtering_stats = {
-                "third_party": 0,
-                "min_length": 0,
-                "consistent": 0,
-                "not_in_storage": 0
-            }
-            seen_headers = {}
-            surviving_headers = []
-
-            for header in all_headers:
-                passed = True
-
-                for curr_func in combo:
-                    if not curr_func(header, seen_headers, storage_values, filtering_stats):
-                        passed = False
-                        break
-
-                if passed:
-                    surviving_headers.append(header)
-
-            output_file = output_folder + "/filtering_combination" + str(n) + ".json"
-            combo_label = f"Combination {n}: " + " + ".join(f.__name__ for f in combo)
+        for combo in itertools.combinations(filters, r):
+            filtering_stats = {f.name: 0 for f in filters}
+            reach = header_table.all_rows
+            for position, f in enumerate(combo):
+                key = (f.name, tuple(g.name for g in combo[:position]) if f.stateful else None)
+                if key not in keep_masks:
+                    keep_masks[key] = f.column(header_table, context, reach)
+                keep = keep_masks[key]
+                filtering_stats[f.name] = header_table.count(reach & ~keep)
+                reach &= keep
+
+            output_file = "filtering_combination" + str(n) + ".json"
+            combo_label = f"Combination {n}: " + " + ".join(f.name for f in combo)
 
             build_combination_report(
-                filtering_stats, len(all_headers), output_file, combo_label
+                filtering_stats, header_table.n_headers, output_folder, output_file, combo_label
             )
             n += 1
 
 #####################################
-# Heuristics/Filters
+# Single-pass engine
 #####################################
-def third_party(header, seen_headers, storage_values, filtering_stats):
-    if header["host_domain"] == header["method_domain"]:
-        filtering_stats["third_party"] += 1
-        return False
-    return True
-
-def min_length(header, seen_headers, storage_values, filtering_stats):
-    if len(urllib.parse.unquote(header["header_value"])) >= 8:
-        filtering_stats["min_length"] += 1
-        return False
-    return True
-
-def consistent(header, seen_headers, storage_values, filtering_stats):
-    if header["header_name"] in seen_headers:
-        if seen_headers[header["header_name"]] != header["header_value"]:
-            filtering_stats["consistent"] += 1
-            return False
-    else:
-        seen_headers[header["header_name"]] = header["header_value"]
-    return True
-
-def not_in_storage(header, seen_headers, storage_values, filtering_stats):
-    if header["header_value"] not in storage_values:
-        filtering_stats["not_in_storage"] += 1
-        return False
-    return True
+def build_filter_slots(filters):
+    # A stateless filter has one pass/fail bit per header. A stateful filter (consistent)
+    # depends on which earlier filters let the header through, so it gets one bit for
+    # every subset of the filters before it.
+    slots = {}
+    for i, curr_filter in enumerate(filters):
+        if curr_filter.stateful:
+            for prefix in range(1 << i):
+                slots[(i, prefix)] = len(slots)
+        else:
+            slots[(i, None)] = len(slots)
+    return slots
+
+def get_slot(slots, i, prefix):
+    if (i, None) in slots:
+        return slots[(i, None)]
+    return slots[(i, prefix)]
+
+def build_required_bits(slots):
+    # Bits that must be set for a header to reach each stateful slot
+    required_bits = {}
+    for (i, prefix) in slots:
+        if prefix is None:
+            continue
+        required = 0
+        for j in range(i):
+            if prefix & (1 << j):
+                required |= 1 << get_slot(slots, j, prefix & ((1 << j) - 1))
+        required_bits[(i, prefix)] = required
+    return required_bits
+
+def header_signature(header, filters, slots, required_bits, states, context):
+    signature = 0
+    for (i, prefix), slot in slots.items():
+        if prefix is None or signature & required_bits[(i, prefix)] == required_bits[(i, prefix)]:
+            passed = filters[i].check(header, context, states[(i, prefix)])
+        else:
+            # Header never reaches this filter under this prefix, the bit is never read
+            passed = False
+        if passed:
+            signature |= 1 << slot
+    return signature
+
+def count_combination_removals(signatures, filters, slots, combo):
+    filtering_stats = {curr_filter.name: 0 for curr_filter in filters}
+
+    # Bit of each filter of the combination, given the filters that come before it
+    combo_bits = []
+    prefix = 0
+    for i in combo:
+        combo_bits.append((filters[i].name, 1 << get_slot(slots, i, prefix)))
+        prefix |= 1 << i
+
+    for signature, count in signatures.items():
+        for name, bit in combo_bits:
+            if not signature & bit:
+                filtering_stats[name] += count
+                break
+
+    return filtering_stats
 
 #####################################
 # Report
 #####################################
-def build_combination_report(stats, total_headers, output_file, label):
+def build_combination_report(stats, total_headers, output_folder, output_file, label):
     report = {label: {}}
     for key, value in stats.items():
         report[label][key] = {
@@ -82,4 +155,4 @@ def build_combination_report(stats, total_headers, output_file, label):
         }
         total_headers = total_headers-value
 
-    save_json(report, output_file)
\ No newline at end of file
+    save_result(report, output_folder, output_file)
\ No newline at end of file
@@ -1,85 +1,62 @@
-import urllib
-import os
-from information_api import save_json
+from result_writer import save_result
+from heuristics import get_heuristics, canonical_predecessors, build_context
 
 #####################################
 # Pipeline
 #####################################
-def heuristics_filtering_pipeline(all_headers, known_standard_headers, storage_values, output_folder):
-    # Initialize counts
-    n_total_headers = 0
-    n_final_headers = 0
-
-    # Initialize header storage
-    custom_headers = []
-    standard_headers = {}
-    seen_headers = {}
-
-    # Compound filtering statistics
-    compound_filtering_stats = {
-        "standard_headers": 0,
-        "third_party": 0,
-        "min_length": 0,
-        "inconsistent": 0,
-        "not_in_storage": 0
-    }
-
-    # Flags to enable desired filters
-    apply_pre_processing = True
-    apply_heuristic_1 = True
-    apply_heuristic_2 = True
-    apply_heuristic_3 = True
-    apply_heuristic_4 = True
-
-
+def heuristics_filtering_pipeline(all_headers, known_standard_headers, storage_values, output_folder,
+                                  order="canonical"):
+    pipeline = FilteringPipeline(known_standard_headers, storage_values, order)
     for curr_header in all_headers:
-        n_total_headers += 1
+        pipeline.add(curr_header)
+    return pipeline.finish(output_folder)
+
+class FilteringPipeline:
+    # Incremental pipeline: headers are fed one at a time (e.g. straight from the network
+    # events), only the headers that pass every filter are kept in memory
+    def __init__(self, known_standard_headers, storage_values, order="canonical"):
+        # Initialize counts
+        self.n_total_headers = 0
+        self.n_final_headers = 0
+
+        # Initialize header storage
+        self.custom_headers = []
+
+        # Heuristics in evaluation order; removals are always reported in canonical order
+        self.heuristics = get_heuristics()
+        self.ordered = get_heuristics(order)
+        self.predecessors = canonical_predecessors(self.heuristics, self.ordered)
+        self.context = build_context(known_standard_headers, storage_values)
+        self.states = {heuristic.name: {} for heuristic in self.heuristics}
+
+        # Compound filtering statistics
+        self.compound_filtering_stats = {heuristic.pipeline_key: 0 for heuristic in self.heuristics}
+
+    def add(self, curr_header):
+        self.n_total_headers += 1
+        context, states = self.context, self.states
 
         # ====
         # Pipeline
-        # ==== Preprocessing: Standard header check
-        if apply_pre_processing:
-            standard_headers, is_custom = check_if_custom_header(
-                curr_header["header_name"], known_standard_headers, standard_headers)
-            if not is_custom:
-                compound_filtering_stats["standard_headers"] += 1
-                continue
-
-        # === Heuristic 1: Third-party association
-        if apply_heuristic_1:
-            is_third_party = check_if_third_party_associated(
-                curr_header["method_domain"], curr_header["host_domain"])
-            if not is_third_party:
-                compound_filtering_stats["third_party"] += 1
-                continue
-
-        # === Heuristic 2: Minimum value length
-        if apply_heuristic_2:
-            is_min_val = check_if_min_value_length(
-                curr_header["header_value"])
-            if not is_min_val:
-                compound_filtering_stats["min_length"] += 1
-                continue
-
-        # === Heuristic 3: Consistent value
-        if apply_heuristic_3:
-            seen_headers, is_consistent = check_if_consistent_value(
-                curr_header["header_name"], curr_header["header_value"], seen_headers)
-            if not is_consistent:
-                compound_filtering_stats["inconsistent"] += 1
-                continue
-
-        # === Heuristic 4: Stored in cookies/local
-        if apply_heuristic_4:
-            is_in_cookies_local = check_if_in_storage(curr_header["header_value"], storage_values)
-            if not is_in_cookies_local:
-                compound_filtering_stats["not_in_storage"] += 1
-                continue
+        removed_by = None
+        for heuristic in self.ordered:
+            if not heuristic.check(curr_header, context, states[heuristic.name]):
+                removed_by = heuristic
+                break
+
+        if removed_by is not None:
+            # Attribute the removal to the first failing heuristic in canonical order
+            for earlier in self.predecessors[removed_by.name]:
+                if not earlier.check(curr_header, context, states[earlier.name]):
+                    removed_by = earlier
+                    break
+            self.compound_filtering_stats[removed_by.pipeline_key] += 1
+            return
 
         # === Passed filters
-        n_final_headers += 1
+        self.n_final_headers += 1
         try:
-            custom_headers.append({
+            self.custom_headers.append({
                 "method": curr_header["method"],
                 "header_name": curr_header["header_name"],
                 "header_value": curr_header["header_value"],
@@ -89,48 +66,63 @@ def heuristics_filtering_pipeline(all_headers, known_standard_headers, storage_v
         except Exception as e:
             print(f"Failed to append header due to: {e}")
 
-    # Output
-    print("Total headers:", n_total_headers)
-    print("Final headers:", n_final_headers)
-    build_compound_filtering_report(compound_filtering_stats, n_total_headers, output_folder)
+    def finish(self, output_folder):
+        # Standard headers seen by the preprocessing step
+        standard_headers = self.states["standard_headers"]
 
-    return custom_headers, standard_headers
+        # Output
+        print("Total headers:", self.n_total_headers)
+        print("Final headers:", self.n_final_headers)
+        build_compound_filtering_report(self.compound_filtering_stats, self.n_total_headers, output_folder)
+
+        return self.custom_headers, standard_headers
 
 #####################################
-# Heuristics/Filters
+# Columnar pipeline
 #####################################
-def check_if_custom_header(name, set_standard_headers, seen_standard_headers):
-    key = name.lower()
-
-    # The header is a standard header
-    if key in set_standard_headers:
-        if key in seen_standard_headers:
-            seen_standard_headers[key] += 1
-        else:
-            seen_standard_headers[key] = 1
-        return seen_standard_headers, 0
-
-    # The header is a custom header
-    return seen_standard_headers, 1
-
-def check_if_third_party_associated(url, hostname):
-    return url != hostname #returns true if they are different
-
-def check_if_min_value_length(value):
-    return len(urllib.parse.unquote(value)) >= 8 #returns true if length is bigger than 8
-
-def check_if_consistent_value(name, value, seen_headers):
-    if name in seen_headers:
-        if seen_headers[name] != value:
-            return seen_headers, 0
-    else:
-        seen_headers[name] = value
-    return seen_headers, 1
-
-def check_if_in_storage(value, set):
-    if value in set:
-        return 1
-    return 0
+def columnar_filtering_pipeline(header_table, known_standard_headers, storage_values, output_folder,
+                                order="canonical"):
+    # Same pipeline as above, each heuristic applied to the rows still in reach at once
+    heuristics = get_heuristics()
+    ordered = get_heuristics(order)
+    predecessors = canonical_predecessors(heuristics, ordered)
+    context = build_context(known_standard_headers, storage_values)
+
+    removed = {heuristic.name: 0 for heuristic in heuristics}
+    reach = header_table.all_rows
+    for heuristic in ordered:
+        keep = heuristic.column(header_table, context, reach)
+        dropped = reach & ~keep
+        reach &= keep
+
+        # Attribute the removals to the first failing heuristic in canonical order
+        for earlier in predecessors[heuristic.name]:
+            if not dropped:
+                break
+            earlier_keep = earlier.column(header_table, context, dropped)
+            removed[earlier.name] |= dropped & ~earlier_keep
+            dropped &= earlier_keep
+        removed[heuristic.name] |= dropped
+
+    compound_filtering_stats = {
+        heuristic.pipeline_key: header_table.count(removed[heuristic.name]) for heuristic in heuristics
+    }
+
+    custom_headers = [{
+        "method": curr_header["method"],
+        "header_name": curr_header["header_name"],
+        "header_value": curr_header["header_value"],
+        "host_domain": curr_header["host_domain"],
+        "method_domain": curr_header["method_domain"]
+    } for curr_header in header_table.occurrences(reach)]
+    standard_headers = header_table.count_names(removed["standard_headers"])
+
+    # Output
+    print("Total headers:", header_table.n_headers)
+    print("Final headers:", len(custom_headers))
+    build_compound_filtering_report(compound_filtering_stats, header_table.n_headers, output_folder)
+
+    return custom_headers, standard_headers
 
 #####################################
 # Report
@@ -144,4 +136,4 @@ def build_compound_filtering_report(stats, total_headers, output_folder):
         }
         total_headers = total_headers-value
 
-    save_json(report, os.path.join(output_folder, "compound_filter_stats.json"))
+    save_result(report, output_folder, "compound_filter_stats.json")
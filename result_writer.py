@@ -0,0 +1,127 @@
+import os
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from information_api import save_json
+from metrics import metrics
+
+# Result folders of a site, replaced as a whole when the site is processed again
+RESULT_FOLDERS = ["pipeline", "stats"]
+STAGING_FOLDER = ".staging"
+OLD_SUFFIX = ".old"
+# One file holding every filtering_combinationN report, when stats are consolidated
+CONSOLIDATED_STATS_FILE = "filtering_combinations.json"
+
+# Background flushes, one at a time, by site folder
+flush_executor = None
+pending_flushes = {}
+
+#####################################
+# Buffered, atomic writer of a site's results
+#####################################
+class ResultWriter:
+    # A site's output files are kept in memory, then written to a staging folder and each
+    # result folder is swapped in by rename. A crash leaves either the previous or the new
+    # folder (a leftover folder.old is restored by the next writer), never a partial one.
+    def __init__(self, site_folder, consolidate_stats=False):
+        self.site_folder = site_folder
+        self.consolidate_stats = consolidate_stats
+        self.files = {folder: {} for folder in RESULT_FOLDERS}
+        recover_site_folder(site_folder)
+
+    def folder(self, name):
+        return ResultFolder(self, name)
+
+    def save(self, data, folder, filename):
+        self.files[folder][filename] = data
+
+    def flush(self, background=False):
+        # In the background, the files are written while the caller goes on;
+        # wait_for_flush(site_folder) waits until they are in place
+        global flush_executor
+        if not background:
+            self.timed_commit()
+            return
+        if flush_executor is None:
+            flush_executor = ThreadPoolExecutor(max_workers=1)
+        pending_flushes[self.site_folder] = flush_executor.submit(self.timed_commit)
+
+    def timed_commit(self):
+        # json_write times the writing itself, also on the flush thread: the site folder
+        # is named after the hostname the site's other metrics are recorded under
+        with metrics.site(os.path.basename(self.site_folder)), metrics.timer("json_write"):
+            self.commit()
+
+    def commit(self):
+        staging_folder = os.path.join(self.site_folder, STAGING_FOLDER)
+        shutil.rmtree(staging_folder, ignore_errors=True)
+
+        folders = [folder for folder in RESULT_FOLDERS if self.files[folder]]
+        for folder in folders:
+            files = self.files[folder]
+            if folder == "stats" and self.consolidate_stats:
+                files = {CONSOLIDATED_STATS_FILE: {os.path.splitext(filename)[0]: data
+                                                   for filename, data in files.items()}}
+            os.makedirs(os.path.join(staging_folder, folder))
+            for filename, data in files.items():
+                write_json(data, os.path.join(staging_folder, folder, filename))
+
+        for folder in folders:
+            swap_folder(os.path.join(staging_folder, folder), os.path.join(self.site_folder, folder))
+        os.rmdir(staging_folder)
+
+class ResultFolder:
+    # Given to the report builders in place of a folder path
+    def __init__(self, writer, name):
+        self.writer = writer
+        self.name = name
+
+    def save(self, data, filename):
+        self.writer.save(data, self.name, filename)
+
+#####################################
+# Helper functions
+#####################################
+def save_result(data, output_folder, filename):
+    # output_folder is a folder path (written now) or a ResultFolder (buffered)
+    if isinstance(output_folder, ResultFolder):
+        output_folder.save(data, filename)
+        return
+    save_json(data, os.path.join(output_folder, filename))
+
+def write_json(data, path):
+    # Same layout as save_json, in one write
+    if isinstance(data, set):
+        data = list(data)
+    with open(path, "w") as f:
+        f.write(json.dumps(data, indent=2))
+
+def swap_folder(new_folder, folder):
+    old_folder = folder + OLD_SUFFIX
+    if os.path.exists(folder):
+        os.rename(folder, old_folder)
+    os.rename(new_folder, folder)
+    shutil.rmtree(old_folder, ignore_errors=True)
+
+def recover_site_folder(site_folder):
+    # Undoes a swap interrupted by a crash: folder.old is the last complete version
+    for folder in RESULT_FOLDERS:
+        path = os.path.join(site_folder, folder)
+        old_path = path + OLD_SUFFIX
+        if not os.path.exists(old_path):
+            continue
+        if os.path.exists(path):
+            shutil.rmtree(old_path)
+        else:
+            os.rename(old_path, path)
+    shutil.rmtree(os.path.join(site_folder, STAGING_FOLDER), ignore_errors=True)
+
+def wait_for_flush(site_folder):
+    future = pending_flushes.pop(site_folder, None)
+    if future is not None:
+        future.result()
+
+def wait_for_flushes():
+    for site_folder in list(pending_flushes):
+        wait_for_flush(site_folder)
@@ -1,6 +1,25 @@
-import requests
-from bs4 import BeautifulSoup
+import os
 import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+from html.parser import HTMLParser
+
+from header_catalog import (
+    HeaderCatalog, read_rules, save_compiled_catalog, compiled_catalog_path, STANDARD_HEADERS_FILE,
+    STANDARD_PATTERNS_FILE
+)
+
+# Snapshots of the reference pages, tracked in sources.json (url, ETag, sha256)
+SNAPSHOT_FOLDER = "standard_header_sources"
+SOURCES_FILE = "sources.json"
+
+SOURCES = {
+    "mdn": "https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers",
+    "rfc4229": "https://www.rfc-editor.org/rfc/rfc4229.html"
+}
 
 def is_probable_header(text):
     http_methods = {
@@ -16,40 +35,153 @@ def is_probable_header(text):
         re.match(r"^[A-Z][A-Za-z0-9\-]*$", text)  # Accept things like "Via", "Vary", "X-Header"
     )
 
-def fetch_mdn_headers():
-    url = "https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers"
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, "html.parser")
+# Elements without an end tag, never open on the stack
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"
+}
+
+#####################################
+# Streaming HTML parsers
+#####################################
+class MDNHeaderParser(HTMLParser):
+    # Text of the <code> tags directly inside a link
+    def __init__(self):
+        super().__init__()
+        self.headers = set()
+        self.stack = []
+        self.text = None
 
-    headers = set()
-    for code_tag in soup.find_all("code"):
-        if code_tag.parent.name == "a":  # ensure it's a linked header name
-            text = code_tag.get_text().strip()
+    def handle_starttag(self, tag, attrs):
+        if tag == "code" and self.stack and self.stack[-1] == "a":
+            self.text = []
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack:
+            return
+        while self.stack.pop() != tag:
+            pass
+        if tag == "code" and self.text is not None:
+            text = "".join(self.text).strip()
             if is_probable_header(text):
-                headers.add(text)
-    return headers
+                self.headers.add(text)
+            self.text = None
+
+    def handle_data(self, data):
+        if self.text is not None:
+            self.text.append(data)
+
+class RFCHeaderParser(HTMLParser):
+    # Text of the <span class="h4"> tags holding "Header field: <name>"
+    def __init__(self):
+        super().__init__()
+        self.headers = set()
+        self.depth = 0
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.depth:
+            self.depth += tag == "span"
+        elif tag == "span" and "h4" in (dict(attrs).get("class") or "").split():
+            self.depth = 1
+            self.text = []
 
-def fetch_rfc_headers():
-    url = "https://www.rfc-editor.org/rfc/rfc4229.html"
-    resp = requests.get(url)
-    soup = BeautifulSoup(resp.text, "html.parser")
+    def handle_endtag(self, tag):
+        if self.depth and tag == "span":
+            self.depth -= 1
+            if not self.depth:
+                text = "".join(self.text).strip()
+                if "Header field:" in text:
+                    self.headers.add(text.split("Header field:")[-1].strip())
 
-    headers = set()
+    def handle_data(self, data):
+        if self.depth:
+            self.text.append(data)
 
-    for span in soup.find_all("span", class_="h4"):
-        text = span.get_text(strip=True)
-        if "Header field:" in text:
-            # Split and get the part after "Header field:"
-            part = text.split("Header field:")[-1].strip()
-            headers.add(part)
+PARSERS = {
+    "mdn": MDNHeaderParser,
+    "rfc4229": RFCHeaderParser
+}
 
-    return headers
+def parse_snapshot(path, parser_class, chunk_size=1 << 16):
+    parser = parser_class()
+    with open(path, "r", encoding="utf-8") as f:
+        for chunk in iter(lambda: f.read(chunk_size), ""):
+            parser.feed(chunk)
+    parser.close()
+    return parser.headers
 
-def create_headers_file(output_txt_file="standard_headers.txt"):
-    mdn_headers = fetch_mdn_headers()
-    rfc_headers = fetch_rfc_headers()
+#####################################
+# Snapshots
+#####################################
+def read_sources(snapshot_folder):
+    path = os.path.join(snapshot_folder, SOURCES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
 
-    all_headers = mdn_headers.union(rfc_headers)
+def save_sources(sources, snapshot_folder):
+    with open(os.path.join(snapshot_folder, SOURCES_FILE), "w") as f:
+        json.dump(sources, f, indent=2, sort_keys=True)
+
+def refresh_snapshots(snapshot_folder=SNAPSHOT_FOLDER):
+    # Only step that uses the network: conditional GET, unchanged pages are kept as they are
+    import requests
+
+    os.makedirs(snapshot_folder, exist_ok=True)
+    sources = read_sources(snapshot_folder)
+    for name, url in SOURCES.items():
+        entry = sources.get(name, {})
+        request_headers = {}
+        if entry.get("etag"):
+            request_headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            request_headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = requests.get(url, headers=request_headers, timeout=30)
+        if response.status_code == 304 and os.path.exists(os.path.join(snapshot_folder, entry.get("file", ""))):
+            print(f"[=] Unchanged: {name}")
+            continue
+        response.raise_for_status()
+
+        content = response.content
+        filename = name + ".html"
+        with open(os.path.join(snapshot_folder, filename), "wb") as f:
+            f.write(content)
+        sources[name] = {
+            "url": url,
+            "file": filename,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256": hashlib.sha256(content).hexdigest(),
+            "fetched": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }
+        print(f"[✓] Updated: {name}")
+    save_sources(sources, snapshot_folder)
+
+def verified_snapshot(snapshot_folder, sources, name):
+    # Path of a snapshot whose content matches the recorded hash
+    entry = sources.get(name)
+    if entry is None:
+        raise FileNotFoundError(f"No snapshot of {name} in {snapshot_folder}, run with --refresh")
+    path = os.path.join(snapshot_folder, entry["file"])
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    if digest != entry["sha256"]:
+        raise ValueError(f"Snapshot {path} does not match {SOURCES_FILE} (sha256 {digest})")
+    return path
+
+#####################################
+# Build
+#####################################
+def create_headers_file(output_txt_file=STANDARD_HEADERS_FILE, snapshot_folder=SNAPSHOT_FOLDER):
+    # Offline and reproducible: same snapshots, same file
+    sources = read_sources(snapshot_folder)
+    all_headers = set()
+    for name, parser_class in PARSERS.items():
+        all_headers |= parse_snapshot(verified_snapshot(snapshot_folder, sources, name), parser_class)
 
     # Save to text file
     with open(output_txt_file, "w") as f:
@@ -58,6 +190,30 @@ def create_headers_file(output_txt_file="standard_headers.txt"):
 
     print(f"Saved {len(all_headers)} headers to {output_txt_file}")
 
+def compile_catalog(headers_file=STANDARD_HEADERS_FILE, patterns_file=STANDARD_PATTERNS_FILE):
+    # Precompiled matcher, loaded by the pipeline instead of parsing the rule files
+    filenames = [headers_file, patterns_file]
+    rules = []
+    for filename in filenames:
+        rules += read_rules(filename)
+    output_file = compiled_catalog_path(filenames)
+    save_compiled_catalog(HeaderCatalog(rules), output_file, filenames)
+    print(f"Compiled {len(rules)} rules to {output_file}")
+
 if __name__ == "__main__":
-    # This block only runs when you execute this file directly
-    create_headers_file()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Build the standard headers file and its compiled catalog.")
+    arg_parser.add_argument("--refresh", action="store_true", help="download new versions of the source pages first")
+    arg_parser.add_argument("--compile-only", action="store_true", help="only compile the existing rule files")
+    arg_parser.add_argument("--snapshots", default=SNAPSHOT_FOLDER)
+    arg_parser.add_argument("--output", default=STANDARD_HEADERS_FILE)
+    args = arg_parser.parse_args()
+
+    if args.refresh:
+        refresh_snapshots(args.snapshots)
+    if not args.compile_only:
+        try:
+            create_headers_file(args.output, args.snapshots)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"[✗] {e}")
+            sys.exit(1)
+    compile_catalog(args.output)
@@ -0,0 +1,128 @@
+import base64
+import binascii
+import re
+import urllib.parse
+from collections import deque
+
+# Stored values shorter than this are too generic to be searched inside header values
+MIN_PATTERN_LENGTH = 8
+
+# Only identifier-like stored values are searched: letters and digits without whitespace or
+# paths (versions, dates and URLs are too common), or long numeric IDs
+IDENTIFIER_PATTERN = re.compile(r"^(?:(?=.*\d)(?=.*[A-Za-z])[^\s/]+|\d{12,})$")
+
+BASE64_PATTERN = re.compile(r"^[A-Za-z0-9+/_-]{12,}={0,2}$")
+
+#####################################
+# Storage matcher
+#####################################
+class StorageMatcher:
+    # Drop-in replacement for the set of storage values: `value in matcher` is True when
+    # the value is stored as-is, or when an identifier-like stored value (>= MIN_PATTERN_LENGTH
+    # chars) appears inside the header value or inside its URL-/base64-decoded form.
+    def __init__(self, storage_values, min_pattern_length=MIN_PATTERN_LENGTH):
+        self.exact = set(storage_values)
+        patterns = {value for value in self.exact
+                    if isinstance(value, str) and len(value) >= min_pattern_length
+                    and IDENTIFIER_PATTERN.match(value)}
+        self.automaton = AhoCorasick(sorted(patterns))
+        self.results = {}
+
+    def __contains__(self, value):
+        if value in self.exact:
+            return True
+        if not isinstance(value, str):
+            return False
+
+        result = self.results.get(value)
+        if result is None:
+            result = self.find(value) is not None
+            self.results[value] = result
+        return result
+
+    def __len__(self):
+        return len(self.exact)
+
+    def __iter__(self):
+        return iter(self.exact)
+
+    def find(self, value):
+        # First stored value contained in any normalized form of the header value
+        for form in normalized_forms(value):
+            match = self.automaton.search(form)
+            if match is not None:
+                return match
+        return None
+
+#####################################
+# Aho-Corasick automaton
+#####################################
+class AhoCorasick:
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]
+
+        # Trie of all patterns
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                state = next_state
+            self.output[state] = pattern
+
+        # Failure links, breadth first; a state inherits the output of its failure state
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                if self.output[next_state] is None:
+                    self.output[next_state] = self.output[self.fail[next_state]]
+
+    def search(self, text):
+        # Returns the first pattern found in text, or None
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
+
+#####################################
+# Helper functions
+#####################################
+def normalized_forms(value):
+    yield value
+
+    decoded = urllib.parse.unquote(value)
+    if decoded != value:
+        yield decoded
+
+    # Base64 / base64url tokens, e.g. encoded JSON carrying a stored ID
+    for token in re.split(r"[\s.:;,]", decoded):
+        if BASE64_PATTERN.match(token):
+            text = decode_base64(token)
+            if text:
+                yield text
+
+def decode_base64(token):
+    token = token.replace("-", "+").replace("_", "/").rstrip("=")
+    token += "=" * (-len(token) % 4)
+    try:
+        return base64.b64decode(token, validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
@@ -0,0 +1,126 @@
+import json
+import asyncio
+import urllib.request
+
+import pytest
+
+websockets = pytest.importorskip("websockets")
+
+from cdp_capture import CDPConnection, capture_site_cdp, serve_fixture
+from information_api import read_capture_file, find_capture_file
+from main import get_hostname
+
+VISITOR_ID = "v1s1t0r2345678"
+FIXTURE_COOKIE = "fixture_id=a1b2c3d4e5f6a7b8"
+
+#####################################
+# Stand-in browser
+#####################################
+def fetch(url, headers):
+    request = urllib.request.Request(url, headers=headers)
+    with urllib.request.urlopen(request) as response:
+        response.read()
+        return dict(response.headers)
+
+async def browse(websocket, session_id, url):
+    # Loads the fixture page and its beacon over HTTP and reports them the way Chrome does:
+    # requestWillBeSent carries the headers known to the renderer, requestWillBeSentExtraInfo
+    # (before or after it) the ones really sent, once per redirect hop of the same requestId
+    async def emit(method, params):
+        await websocket.send(json.dumps({"method": method, "params": params, "sessionId": session_id},
+                                        separators=(",", ":")))
+
+    page_headers = {"User-Agent": "Fixture/1.0", "Cookie": FIXTURE_COOKIE}
+    page_response = await asyncio.to_thread(fetch, url, page_headers)
+    # Hop 1: the page redirected from /start; hop 2: the page itself
+    await emit("Network.requestWillBeSent", {"requestId": "1", "request": {
+        "url": url + "start", "headers": {"User-Agent": "Fixture/1.0"}}})
+    await emit("Network.requestWillBeSentExtraInfo", {"requestId": "1", "headers": {
+        ":path": "/start", "User-Agent": "Fixture/1.0", "X-Hop": "first-hop-0001"}})
+    await emit("Network.requestWillBeSentExtraInfo", {"requestId": "1", "headers": {
+        ":path": "/", "User-Agent": "Fixture/1.0", "Cookie": FIXTURE_COOKIE}})
+    await emit("Network.requestWillBeSent", {"requestId": "1", "request": {
+        "url": url, "headers": {"User-Agent": "Fixture/1.0"}}})
+    await emit("Network.responseReceived", {"requestId": "1", "response": {"url": url, "headers": page_response}})
+
+    beacon_url = url + "beacon"
+    beacon_headers = {"X-Visitor-Id": VISITOR_ID, "Cookie": FIXTURE_COOKIE}
+    beacon_response = await asyncio.to_thread(fetch, beacon_url, beacon_headers)
+    await emit("Network.requestWillBeSentExtraInfo", {"requestId": "2", "headers": beacon_headers})
+    await emit("Network.requestWillBeSent", {"requestId": "2", "request": {
+        "url": beacon_url, "headers": {"X-Visitor-Id": VISITOR_ID}}})
+    await emit("Network.responseReceived", {"requestId": "2", "response": {
+        "url": beacon_url, "headers": beacon_response}})
+
+async def devtools(websocket):
+    async for raw_message in websocket:
+        message = json.loads(raw_message)
+        session_id = message.get("sessionId")
+        method = message["method"]
+        result = {}
+        if method == "Target.createBrowserContext":
+            result = {"browserContextId": "context"}
+        elif method == "Target.createTarget":
+            result = {"targetId": "target"}
+        elif method == "Target.attachToTarget":
+            result = {"sessionId": "session"}
+        elif method == "Page.navigate":
+            await browse(websocket, session_id, message["params"]["url"])
+            result = {"frameId": "frame"}
+        elif method == "Network.getCookies":
+            result = {"cookies": [{"name": "fixture_id", "value": "a1b2c3d4e5f6a7b8"}]}
+        elif method == "Runtime.evaluate":
+            storage = {"visitor": json.dumps({"id": VISITOR_ID})} if "localStorage" in message["params"]["expression"] else {}
+            result = {"result": {"type": "object", "value": storage}}
+        reply = {"id": message["id"], "result": result}
+        if session_id is not None:
+            reply["sessionId"] = session_id
+        await websocket.send(json.dumps(reply))
+
+def capture_fixture(output_folder, save_all_headers=True):
+    server, url = serve_fixture()
+
+    async def run():
+        async with websockets.serve(devtools, "127.0.0.1", 0) as devtools_server:
+            port = devtools_server.sockets[0].getsockname()[1]
+            connection = await CDPConnection.connect(f"ws://127.0.0.1:{port}")
+            try:
+                return await capture_site_cdp(connection, url, str(output_folder), quiet_window=0.2, max_wait=2,
+                                              save_all_headers=save_all_headers)
+            finally:
+                await connection.close()
+
+    try:
+        assert asyncio.run(run())
+    finally:
+        server.shutdown()
+    return str(output_folder / get_hostname(url) / "capture")
+
+#####################################
+# Tests
+#####################################
+def test_extra_info_headers_are_merged_per_hop(tmp_path):
+    capture_folder = capture_fixture(tmp_path)
+    requests = [event["params"] for event in read_capture_file(capture_folder + "/network_events")
+                if event["method"] == "Network.requestWillBeSent"]
+
+    # Each hop gets the headers sent for it, without the HTTP/2 pseudo-headers
+    first_hop, page, beacon = [request["request"]["headers"] for request in requests]
+    assert first_hop == {"User-Agent": "Fixture/1.0", "X-Hop": "first-hop-0001"}
+    assert page == {"User-Agent": "Fixture/1.0", "Cookie": FIXTURE_COOKIE}
+    # Extra info received before its request is merged as well
+    assert beacon == {"X-Visitor-Id": VISITOR_ID, "Cookie": FIXTURE_COOKIE}
+
+    headers = {(header["method"], header["header_name"], header["header_value"])
+               for header in read_capture_file(capture_folder + "/all_headers")}
+    assert ("REQUEST", "Cookie", FIXTURE_COOKIE) in headers
+    assert ("REQUEST", "X-Visitor-Id", VISITOR_ID) in headers
+    # Response headers of the fixture server
+    assert ("RESPONSE", "X-Fixture-Trace", "tr4c3a1b2c3d4e5") in headers
+    assert not any(name.startswith(":") for _, name, _ in headers)
+
+def test_all_headers_are_not_saved_when_disabled(tmp_path):
+    capture_folder = capture_fixture(tmp_path, save_all_headers=False)
+    with pytest.raises(FileNotFoundError):
+        find_capture_file(capture_folder + "/all_headers")
+    assert read_capture_file(capture_folder + "/network_events")
@@ -0,0 +1,55 @@
+from driver_pool import DriverPool
+
+class FakeDriver:
+    # Storage per origin; like older Chrome versions, the "*" origin is not supported
+    def __init__(self):
+        self.storage = {}
+        self.frames = []
+
+    def visit(self, page_origin, iframe_origins=()):
+        self.frames = [page_origin, *iframe_origins]
+        for origin in self.frames:
+            self.storage.setdefault(origin, {})["id"] = page_origin
+
+    def execute_cdp_cmd(self, command, params):
+        if command == "Page.getFrameTree":
+            page, *iframes = self.frames or ["about:blank"]
+            return {"frameTree": {
+                "frame": {"securityOrigin": page},
+                "childFrames": [{"frame": {"securityOrigin": origin}} for origin in iframes]
+            }}
+        if command == "Storage.clearDataForOrigin":
+            if params["origin"] == "*":
+                raise RuntimeError("Invalid origin")
+            self.storage.pop(params["origin"], None)
+        return {}
+
+    def get(self, url):
+        self.frames = []
+
+    def get_log(self, name):
+        return []
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    def set_script_timeout(self, seconds):
+        pass
+
+    def quit(self):
+        pass
+
+def test_second_site_sees_empty_storage():
+    driver = FakeDriver()
+    pool = DriverPool(lambda: driver, size=1)
+
+    def first_site(url, driver):
+        driver.visit("https://first.example", ["https://ads.tracker.example", "https://cdn.example"])
+        return True
+
+    def second_site(url, driver):
+        return dict(driver.storage)
+
+    assert pool.run(first_site, "https://first.example")
+    assert pool.run(second_site, "https://second.example") == {}
+    pool.close()
@@ -0,0 +1,23 @@
+import os
+import json
+
+import pytest
+
+from information_api import JsonListWriter
+
+def test_complete_list_is_renamed_in_place(tmp_path):
+    path = str(tmp_path / "capture" / "all_headers.json")
+    with JsonListWriter(path) as writer:
+        writer.write({"header_name": "x-a"})
+        writer.write({"header_name": "x-b"})
+    with open(path) as f:
+        assert json.load(f) == [{"header_name": "x-a"}, {"header_name": "x-b"}]
+    assert os.listdir(tmp_path / "capture") == ["all_headers.json"]
+
+def test_failed_capture_leaves_no_file(tmp_path):
+    path = str(tmp_path / "capture" / "all_headers.json")
+    with pytest.raises(RuntimeError):
+        with JsonListWriter(path) as writer:
+            writer.write({"header_name": "x-a"})
+            raise RuntimeError("capture failed")
+    assert os.listdir(tmp_path / "capture") == []
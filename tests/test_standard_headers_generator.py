@@ -0,0 +1,31 @@
+import os
+import shutil
+
+import pytest
+
+from standardHeadersFileGenerator import create_headers_file, MDNHeaderParser
+
+SNAPSHOT_FOLDER = os.path.join(os.path.dirname(__file__), "fixtures", "standard_header_sources")
+
+def test_headers_file_from_committed_snapshots(tmp_path):
+    output_file = tmp_path / "standard_headers.txt"
+    create_headers_file(str(output_file), SNAPSHOT_FOLDER)
+
+    assert output_file.read_text().splitlines() == [
+        "A-IM", "Accept", "Age", "Authorization", "Cache-Control", "Link", "Via", "WWW-Authenticate"
+    ]
+
+def test_modified_snapshot_is_rejected(tmp_path):
+    snapshot_folder = tmp_path / "sources"
+    shutil.copytree(SNAPSHOT_FOLDER, snapshot_folder)
+    with open(snapshot_folder / "mdn.html", "a") as f:
+        f.write("<!-- edited -->")
+
+    with pytest.raises(ValueError):
+        create_headers_file(str(tmp_path / "standard_headers.txt"), str(snapshot_folder))
+
+def test_code_after_void_element_in_link():
+    parser = MDNHeaderParser()
+    parser.feed('<a href="#"><img src="x"><code>Via</code></a><a><br/><code>Vary</code></a>')
+    parser.close()
+    assert parser.headers == {"Via", "Vary"}